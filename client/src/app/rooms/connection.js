@@ -12,6 +12,9 @@ import {MESSAGE_TYPES} from './constants';
 import {default as FileTransferManager, STATUSES as FILETRANSFER_STATUSES} from 'lib/filetransfer';
 import {FrSdFileSender} from 'lib/filetransfer/http/sender';
 
+// the number of messages the server sends per page of history by default
+const MESSAGE_PAGE_SIZE = 100;
+
 export default class RoomConnection extends WildEmitter {
     /**
      * Handles the connection to the signalling server, and to the RTC peers.
@@ -119,10 +122,13 @@ export default class RoomConnection extends WildEmitter {
         this.socket.restart();
     }
 
-    getMessages({until} = {}) {
+    getMessages({until, untilId} = {}) {
         let url;
         if (until) {
             url = `${this.urls.messages}?until=${until}`;
+            if (untilId != null) {
+                url += `&until_id=${untilId}`;
+            }
         }
         else {
             url = this.urls.messages;
@@ -130,12 +136,32 @@ export default class RoomConnection extends WildEmitter {
         return fetchJSON(url);
     }
 
+    async getMessagePage({until, untilId} = {}) {
+        /**
+         * Fetch one page of message history, newest first, along with the
+         * cursor to pass back for the page before it (null if this was
+         * the first page).
+         */
+        let messages = await this.getMessages({until, untilId});
+        let cursor = null;
+        if (messages.length >= MESSAGE_PAGE_SIZE) {
+            let last = messages[messages.length - 1];
+            cursor = {until: last.timestamp, untilId: last.id};
+        }
+        return {messages, cursor};
+    }
+
     handleSocketMessage(message) {
         /**
          * Dispatches a message received from the socket.
          * @private
          * @param {obj} message: the received message
          */
+        if (Array.isArray(message)) {
+            // several coalesced messages packed into one frame
+            message.forEach(m => this.handleSocketMessage(m));
+            return;
+        }
         let msgData = Message.decode(message);
         msgData.room = this.room;
 
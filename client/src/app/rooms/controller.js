@@ -189,6 +189,15 @@ export default class RoomController {
         rec.membership.currentRecording = rec;
     }
 
+    @on('connection.event.updateRecordings')
+    @action.bound
+    handleRecordingsUpdate(changes) {
+        // only the recordings that changed, from one sync
+        for (let change of changes) {
+            this.handleRecordingStatusUpdate(change);
+        }
+    }
+
     /* ---- PEER AND JOIN EVENTS ---- */
 
     @on('connection.peerAdded')
@@ -263,16 +272,19 @@ export default class RoomController {
             name: data.self.info.name,
             uid: data.self.uid,
         });
-        let messagesData;
+        // only the latest page; older ones are loaded as the user scrolls
+        // back (see loadOlderMessages)
+        let page;
         try {
-            messagesData = await this.connection.getMessages({until: message.timestamp});
+            page = await this.connection.getMessagePage({until: message.timestamp});
         }
         catch (err) {
             this.logger.error(err);
             this.connection.restart();
             return;
         }
-        this.room.updateMessagesFromServer(messagesData);
+        this.room.updateMessagesFromServer(page.messages);
+        this.room.setMessageHistoryCursor(page.cursor);
         this.connection.updateRecordings(_.map(
             this.room.memberships.self.recordings,
             r => r.serialize()
@@ -431,6 +443,30 @@ export default class RoomController {
         }, {sendPromise: promise});
     }
 
+    @action.bound
+    async loadOlderMessages() {
+        /**
+         * Load the page of message history before the oldest one loaded so
+         * far, e.g. when scrolling back through the messages.
+         */
+        let cursor = this.room.messageHistoryCursor;
+        if (cursor == null || this.room.loadingMessageHistory) {
+            return;
+        }
+        this.room.setLoadingMessageHistory(true);
+        try {
+            let page = await this.connection.getMessagePage(cursor);
+            this.room.updateMessagesFromServer(page.messages);
+            this.room.setMessageHistoryCursor(page.cursor);
+        }
+        catch (err) {
+            this.logger.error(err);
+        }
+        finally {
+            this.room.setLoadingMessageHistory(false);
+        }
+    }
+
     @action.bound
     requestStartRecording(user, {when}) {
         return this.connection.runAction('startRecording', {peerId:user.peerId, when: +(when)});
@@ -119,6 +119,10 @@ export default class Room {
         debugMode: null,
         uploadMode: null,
     };
+    // where to continue loading message history from, or null if it's all
+    // been loaded
+    @observable.ref messageHistoryCursor = null;
+    @observable loadingMessageHistory = false;
     id = null;
     ownerId = null;
 
@@ -153,6 +157,14 @@ export default class Room {
         this.messageStore.updateFromServer(updates, this);
     }
 
+    @action setMessageHistoryCursor(cursor) {
+        this.messageHistoryCursor = cursor;
+    }
+
+    @action setLoadingMessageHistory(loading) {
+        this.loadingMessageHistory = loading;
+    }
+
     @computed get url() {
         return `${window.location.origin}/${this.id}/`;
     }
@@ -224,8 +224,27 @@ export default class MessagesPanel extends React.Component {
         super(props);
         this.state = {text: ""};
     }
+    componentDidMount() {
+        this.firstMessage = this.props.room.messages[0];
+    }
+    componentWillUpdate() {
+        this.scrollFromBottom = this.ul.scrollHeight - this.ul.scrollTop;
+    }
     componentDidUpdate() {
-        this.ul.scrollTop = this.ul.scrollHeight;
+        let firstMessage = this.props.room.messages[0];
+        if (this.firstMessage != null && firstMessage !== this.firstMessage) {
+            // older messages were loaded: stay where we were
+            this.ul.scrollTop = this.ul.scrollHeight - this.scrollFromBottom;
+        }
+        else {
+            this.ul.scrollTop = this.ul.scrollHeight;
+        }
+        this.firstMessage = firstMessage;
+    }
+    onScroll() {
+        if (this.ul.scrollTop == 0) {
+            this.props.controller.loadOlderMessages();
+        }
     }
     onChatKeyDown(e) {
         if (e.keyCode == 13 && !(e.shiftKey)) {
@@ -247,7 +266,7 @@ export default class MessagesPanel extends React.Component {
         return (
             <div className="messages-panel panel">
                 <h2>Messages</h2>
-                <ul ref={(ul) => {this.ul = ul;}}>
+                <ul ref={(ul) => {this.ul = ul;}} onScroll={this.onScroll.bind(this)}>
                     {_.map(this.props.room.messages, (message) => (
                         message && <li key={`${message.id}:${message.timestamp}:${message.type}`}>
                             <Message message={message} {...this.props} />
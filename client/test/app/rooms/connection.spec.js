@@ -1,5 +1,6 @@
 /* eslint-disable no-undef */
 
+import _ from 'lodash';
 import RoomConnection from 'app/rooms/connection';
 import Peer from 'lib/rtc/peer';
 import MemFS from 'lib/fs/memfs';
@@ -465,6 +466,26 @@ describe("RoomConnection", function() {
             let d = +(new Date);
             rc.getMessages({until: d});
             expect(http.fetchJSON).to.have.been.calledWith(`/test/messages/url/?until=${d}`);
+            http.fetchJSON.reset();
+            rc.getMessages({until: d, untilId: 5});
+            expect(http.fetchJSON).to.have.been.calledWith(`/test/messages/url/?until=${d}&until_id=5`);
+        });
+
+        it('getMessagePage returns a cursor for the page before a full one', async () => {
+            let full = _.map(_.range(100), i => ({id: 200 - i, timestamp: 1000 - i}));
+            sinon.stub(rc, 'getMessages').resolves(full);
+            let page = await rc.getMessagePage({until: 2000});
+            expect(rc.getMessages).to.have.been.calledOnce;
+            expect(rc.getMessages).to.have.been.calledWith({until: 2000, untilId: undefined});
+            expect(page.messages).to.equal(full);
+            expect(page.cursor).to.deep.equal({until: 901, untilId: 101});
+        });
+
+        it('getMessagePage returns no cursor for the first page', async () => {
+            sinon.stub(rc, 'getMessages').resolves([{id: 50, timestamp: 800}]);
+            let page = await rc.getMessagePage({until: 901, untilId: 101});
+            expect(rc.getMessages).to.have.been.calledWith({until: 901, untilId: 101});
+            expect(page.cursor).to.be.null;
         });
 
         it('Has a restart method that restarts the socket', () => {
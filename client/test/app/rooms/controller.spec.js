@@ -185,16 +185,19 @@ describe("RoomController", function() {
                 })
             });
             it('Gets and updates messages from server', async () => {
-                let stub = sinon.stub(rc.connection, 'getMessages');
-                stub.resolves([{id: 213}, {id: 214}]);
+                let stub = sinon.stub(rc.connection, 'getMessagePage');
+                let cursor = {until: 1000, untilId: 213};
+                stub.resolves({messages: [{id: 213}, {id: 214}], cursor});
                 let stub2 = sinon.stub(rc.room, 'updateMessagesFromServer');
                 rc.connection.emit('join', message.payload, message);
                 await sleep(10);
+                expect(stub).to.have.been.calledOnce;
                 expect(stub).to.have.been.calledWith({until: message.timestamp});
                 expect(stub2).to.have.been.calledWith([{id: 213}, {id: 214}]);
+                expect(rc.room.messageHistoryCursor).to.equal(cursor);
             });
             it('If getting messages fails, restarts connection', async () => {
-                let stub = sinon.stub(rc.connection, 'getMessages');
+                let stub = sinon.stub(rc.connection, 'getMessagePage');
                 let stub2 = sinon.stub(rc.connection, 'restart');
                 stub.rejects();
                 rc.connection.emit('join', message.payload, message);
@@ -202,8 +205,8 @@ describe("RoomController", function() {
                 expect(stub2.calledOnce).to.be.true;
             })
             it('Tries to open the FS', async () => {
-                let stub = sinon.stub(rc.connection, 'getMessages');
-                stub.resolves([{id: 213}, {id: 214}]);
+                let stub = sinon.stub(rc.connection, 'getMessagePage');
+                stub.resolves({messages: [{id: 213}, {id: 214}], cursor: null});
                 let stub2 = sinon.stub(rc, 'openFS');
                 rc.connection.emit('join', message.payload, message);
                 await sleep(10);
@@ -410,6 +413,22 @@ describe("RoomController", function() {
             expect(result.status).to.equal('pending');
         });
 
+        it('loadOlderMessages loads the page before the oldest one loaded', async () => {
+            let cursor = {until: 1000, untilId: 213};
+            rc.room.setMessageHistoryCursor(cursor);
+            let stub = sinon.stub(rc.connection, 'getMessagePage');
+            stub.resolves({messages: [{id: 212}], cursor: null});
+            let stub2 = sinon.stub(rc.room, 'updateMessagesFromServer');
+            await rc.loadOlderMessages();
+            expect(stub).to.have.been.calledWith(cursor);
+            expect(stub2).to.have.been.calledWith([{id: 212}]);
+            expect(rc.room.messageHistoryCursor).to.be.null;
+            expect(rc.room.loadingMessageHistory).to.be.false;
+            // all of the history has been loaded
+            await rc.loadOlderMessages();
+            expect(stub).to.have.been.calledOnce;
+        });
+
         it(`requestStartRecording/requestStopRecording are passed through to
             runAction`, () => {
             sinon.stub(rc.connection, 'runAction');
@@ -0,0 +1,257 @@
+"""
+Counters and latency histograms for the realtime server, in the Prometheus
+text format.
+
+Each process accumulates its observations in memory, and adds them to
+totals in Redis every FIRESIDE_METRICS_FLUSH_INTERVAL seconds from a
+background thread, so that the metrics endpoint reports the sum across
+all of the server and worker processes.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'metrics:'
+
+#: Buckets for latency histograms, in seconds.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+
+registry = {}
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in sorted(labels.items())
+    )
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry[name] = self
+
+    def check_labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f'{self.name} takes labels {self.labelnames}, '
+                f'got {tuple(labels)}'
+            )
+
+    def render(self, totals):
+        """
+        Render the metric from `totals` (a dict of sample field to value,
+        as stored in Redis) in the text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for field, value in sorted(totals.items(), key=sample_sort_key):
+            suffix, labels = field.split('|', 1)
+            labels = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}{suffix}{labels} {format_value(value)}')
+        return lines
+
+
+def sample_sort_key(item):
+    # keep the buckets of a histogram in order
+    field = item[0]
+    suffix, labels = field.split('|', 1)
+    le = ''
+    if 'le="' in labels:
+        start = labels.index('le="') + 4
+        le = labels[start:labels.index('"', start)]
+        labels = labels.replace(f'le="{le}"', '').rstrip(',')
+    return (labels, suffix, float(le) if le else 0)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.check_labels(labels)
+        collector.add(self.name, f'_total|{format_labels(labels)}', amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        self.check_labels(labels)
+        collector.observe(self, format_labels(labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def timed(histogram, **labels):
+    """Decorator to time calls of a function with `histogram`."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Collector:
+    """
+    Accumulates observations in this process, and adds them to the totals
+    in Redis when flushed.
+    """
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name, field, amount):
+        if not settings.FIRESIDE_METRICS_ENABLED:
+            return
+        self.start()
+        with self._lock:
+            self._values[name, field] += amount
+
+    def observe(self, histogram, label_str, value):
+        if not settings.FIRESIDE_METRICS_ENABLED:
+            return
+        self.start()
+        sep = ',' if label_str else ''
+        with self._lock:
+            # buckets are cumulative
+            for bound in histogram.buckets:
+                if value <= bound:
+                    self._values[
+                        histogram.name, f'_bucket|{label_str}{sep}le="{bound}"'
+                    ] += 1
+            self._values[
+                histogram.name, f'_bucket|{label_str}{sep}le="+Inf"'
+            ] += 1
+            self._values[histogram.name, f'_sum|{label_str}'] += value
+            self._values[histogram.name, f'_count|{label_str}'] += 1
+
+    def flush(self):
+        from fireside import redis_conn
+        with self._lock:
+            values, self._values = self._values, defaultdict(float)
+        if not values:
+            return
+        pipe = redis_conn.pipeline(transaction=False)
+        for (name, field), amount in values.items():
+            pipe.hincrbyfloat(KEY_PREFIX + name, field, amount)
+        pipe.execute()
+
+    def start(self):
+        if self._thread is not None or settings.TEST:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='MetricsCollector',
+                    daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(
+                self.interval or settings.FIRESIDE_METRICS_FLUSH_INTERVAL
+            )
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Metrics flush failed')
+
+
+collector = Collector()
+
+
+def render():
+    """All registered metrics, summed across processes, as text."""
+    from fireside import redis_conn
+    collector.flush()
+    pipe = redis_conn.pipeline(transaction=False)
+    for name in registry:
+        pipe.hgetall(KEY_PREFIX + name)
+    lines = []
+    for metric, totals in zip(registry.values(), pipe.execute()):
+        lines.extend(metric.render(totals))
+    return '\n'.join(lines) + '\n'
+
+
+messages_received = Counter(
+    'fireside_messages_received',
+    'Messages received by RoomConsumer.',
+    ['type', 'event_type'],
+)
+messages_sent = Counter(
+    'fireside_messages_sent',
+    'Messages sent by Room.send.',
+    ['type', 'event_type'],
+)
+message_fanout = Histogram(
+    'fireside_message_fanout',
+    'Number of peers a message sent to the whole room goes to, for a '
+    'sample of messages (FIRESIDE_METRICS_FANOUT_SAMPLE_RATE).',
+    ['type'],
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+consumer_latency = Histogram(
+    'fireside_consumer_seconds',
+    'Time spent handling a message in RoomConsumer.',
+    ['handler', 'type', 'event_type'],
+)
+redis_latency = Histogram(
+    'fireside_peers_redis_seconds',
+    'Time spent on Redis calls in PeerManager.',
+    ['operation'],
+)
+view_latency = Histogram(
+    'fireside_view_seconds',
+    'Time spent handling HTTP requests.',
+    ['view', 'method', 'status'],
+)
+trace_hop_latency = Histogram(
+    'fireside_trace_hop_seconds',
+    'Time taken by each hop of traced messages through the pipeline.',
+    ['hop', 'type', 'event_type'],
+)
+trace_latency = Histogram(
+    'fireside_trace_seconds',
+    'Time from a traced message arriving on a socket to its last hop.',
+    ['type', 'event_type'],
+)
@@ -0,0 +1,23 @@
+import time
+
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Records how long each request takes, by view."""
+    def process_request(self, request):
+        request._metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is not None:
+            match = getattr(request, 'resolver_match', None)
+            metrics.view_latency.observe(
+                time.perf_counter() - start,
+                view=match.view_name if match else '',
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'fireside.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -159,8 +160,114 @@ CHANNEL_LAYERS = {
 # Sessions expire in 10 years
 SESSION_COOKIE_AGE = 60*60*24*365*10
 
+# Channel sessions are kept in Redis rather than the database, and expire
+# a week after they were last saved
+CHANNEL_SESSION_ENGINE = 'rooms.channel_sessions'
+FIRESIDE_CHANNEL_SESSION_TTL = 60 * 60 * 24 * 7
+
 FIRESIDE_HTTP_UPLOAD_ENABLED = False
 
+# Chunks of HTTP uploads in progress are stored here
+FIRESIDE_UPLOAD_ROOT = env(
+    'FIRESIDE_UPLOAD_ROOT', default=str(BASE_DIR.path('media', 'uploads'))
+)
+# Completed recordings are stored here (and downloaded through
+# rooms:recording_download)
+FIRESIDE_RECORDINGS_ROOT = env(
+    'FIRESIDE_RECORDINGS_ROOT',
+    default=str(BASE_DIR.path('media', 'recordings'))
+)
+# How long the URL for uploading a chunk is valid for, in seconds
+FIRESIDE_UPLOAD_CHUNK_URL_MAX_AGE = 60 * 60 * 24
+# Threads per process for joining the chunks of completed uploads
+FIRESIDE_UPLOAD_ASSEMBLY_WORKERS = 2
+# After how many seconds an upload that's still being assembled is assumed
+# to have been abandoned (e.g. by a crashed process), so that completing
+# it again starts over
+FIRESIDE_UPLOAD_ASSEMBLY_TIMEOUT = 60 * 10
+# How often the live state of active recordings is written from Redis to the
+# database, in seconds, and how long it is kept in Redis if never stopped
+FIRESIDE_RECORDING_FLUSH_INTERVAL = 30.0
+FIRESIDE_RECORDING_STATE_TTL = 60 * 60 * 24
+# Metrics, summed across processes in Redis, and served at /metrics/ to
+# FIRESIDE_METRICS_ALLOWED_IPS (addresses or networks, e.g. 10.0.0.0/8).
+# nginx doesn't pass /metrics/ on, so scrape the server directly, and allow
+# the scraper's address or network here (docker-compose.yml allows the
+# docker networks)
+FIRESIDE_METRICS_ENABLED = env.bool('FIRESIDE_METRICS_ENABLED', default=True)
+FIRESIDE_METRICS_FLUSH_INTERVAL = 10.0
+# Fraction of messages sent to a whole room to count the peers of
+FIRESIDE_METRICS_FANOUT_SAMPLE_RATE = 0.01
+FIRESIDE_METRICS_ALLOWED_IPS = env.list(
+    'FIRESIDE_METRICS_ALLOWED_IPS', default=['127.0.0.1']
+)
+# Fraction of incoming messages to trace through the channel pipeline, and
+# of those taking over FIRESIDE_TRACE_SLOW_THRESHOLD seconds, how many to log
+FIRESIDE_TRACE_SAMPLE_RATE = env.float(
+    'FIRESIDE_TRACE_SAMPLE_RATE', default=0.0
+)
+FIRESIDE_TRACE_SLOW_THRESHOLD = 0.5
+FIRESIDE_TRACE_SLOW_LOG_SAMPLE_RATE = 0.1
+# For the asyncio room worker (manage.py runroomworker): the size of its
+# Redis connection pool, threads for blocking ORM and channel layer calls,
+# and the most messages it handles at once
+FIRESIDE_ASYNC_REDIS_POOL_SIZE = 20
+FIRESIDE_ASYNC_DB_THREADS = 10
+FIRESIDE_ASYNC_MAX_TASKS = 1000
+# Internal nginx location that serves FIRESIDE_RECORDINGS_ROOT. Downloads are
+# handed to it with X-Accel-Redirect; if empty, Django streams them itself.
+FIRESIDE_RECORDINGS_ACCEL_PREFIX = env(
+    'FIRESIDE_RECORDINGS_ACCEL_PREFIX', default='/internal/recordings/'
+)
+
+# Number of shards to split the room.* channels into. See rooms.sharding.
+FIRESIDE_ROOM_SHARDS = env.int('FIRESIDE_ROOM_SHARDS', default=1)
+
+# Per-process cache of rooms and participants in the channel workers
+FIRESIDE_MODEL_CACHE_MAXSIZE = env.int(
+    'FIRESIDE_MODEL_CACHE_MAXSIZE', default=1000
+)
+FIRESIDE_MODEL_CACHE_TTL = env.int('FIRESIDE_MODEL_CACHE_TTL', default=60)
+# How long to remember which channel a peer is connected on, for relaying
+# signalling messages
+FIRESIDE_PEER_CHANNEL_CACHE_TTL = 300
+# In-process cache of channel sessions, so that handling a frame doesn't
+# need to fetch its session
+FIRESIDE_CHANNEL_SESSION_CACHE_MAXSIZE = 10000
+FIRESIDE_CHANNEL_SESSION_CACHE_TTL = 60
+# In-process cache of which participant each user and session maps to
+FIRESIDE_PARTICIPANT_ID_CACHE_MAXSIZE = 10000
+FIRESIDE_PARTICIPANT_ID_CACHE_TTL = 300
+# How long to keep the room-level part of the room page's bootstrap
+# document (see rooms.bootstrap) in Redis
+FIRESIDE_ROOM_BOOTSTRAP_TTL = 3600
+# How long to keep room configs (see rooms.roomconfig) in Redis
+FIRESIDE_ROOM_CONFIG_TTL = 60 * 60 * 24
+
+# Use ujson (if installed) to encode outgoing messages
+FIRESIDE_FAST_JSON = env.bool('FIRESIDE_FAST_JSON', default=False)
+
+# Seconds between sending the latest meter levels, upload progress and
+# disk/resource status of each peer, rather than relaying every update.
+# 0 sends them immediately.
+FIRESIDE_EVENT_COALESCE_INTERVAL = env.float(
+    'FIRESIDE_EVENT_COALESCE_INTERVAL', default=0
+)
+# Send all of a room's coalesced events in one frame
+FIRESIDE_EVENT_COALESCE_PACK = env.bool(
+    'FIRESIDE_EVENT_COALESCE_PACK', default=False
+)
+
+# Write room messages in batches after they have been broadcast
+FIRESIDE_MESSAGE_WRITE_BEHIND = env.bool(
+    'FIRESIDE_MESSAGE_WRITE_BEHIND', default=False
+)
+FIRESIDE_MESSAGE_BATCH_SIZE = 100
+# seconds
+FIRESIDE_MESSAGE_FLUSH_INTERVAL = 1.0
+# seconds; once messages have waited this long, queueing another flushes them
+FIRESIDE_MESSAGE_MAX_QUEUE_AGE = 5.0
+
 RAVEN_CONFIG = {
     'dsn': env('SENTRY_DSN'),
     # If you are using git, you can also automatically configure the
@@ -10,6 +10,7 @@ urlpatterns = [
     url(r'^rooms/', include(rooms.urls, namespace='rooms')),
     url(r'^$', views.index),
     url(r'^ntp/$', views.ntp),
+    url(r'^metrics/$', views.metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
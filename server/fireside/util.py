@@ -1,4 +1,5 @@
 import datetime
+from django.utils import timezone
 from rest_framework.serializers import Field, ValidationError
 
 
@@ -6,7 +7,8 @@ class TimestampField(Field):
     def to_internal_value(self, value):
         if not isinstance(value, str) and not isinstance(value, int):
             raise ValidationError('Incorrect input type.')
-        return datetime.datetime.fromtimestamp(int(value) / 1000)
+        # aware, so that it compares equal to what's in the database
+        return datetime.datetime.fromtimestamp(int(value) / 1000, timezone.utc)
 
     def to_representation(self, value):
-        return int(value.timestamp() * 1000)
+        return round(value.timestamp() * 1000)
@@ -1,8 +1,32 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 from time import time
+import ipaddress
+from . import metrics
 
 def index(request):
     return render(request, 'index.html')
 
 def ntp(request):
-    return str(time())
\ No newline at end of file
+    return str(time())
+
+
+def is_metrics_client(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(allowed, strict=False)
+        for allowed in settings.FIRESIDE_METRICS_ALLOWED_IPS
+    )
+
+
+def metrics_view(request):
+    if not is_metrics_client(request.META.get('REMOTE_ADDR')):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
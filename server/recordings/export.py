@@ -0,0 +1,100 @@
+import os
+import zipfile
+
+#: size of the pieces files are read in
+BUFFER_SIZE = 64 * 1024
+
+
+class StreamBuffer:
+    """
+    A write-only, unseekable file for ZipFile to write to. Whatever has
+    been written is collected with `pop()`.
+    """
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def unique_name(name, used):
+    base, ext = os.path.splitext(name)
+    n = 1
+    while name in used:
+        n += 1
+        name = f'{base} ({n}){ext}'
+    used.add(name)
+    return name
+
+
+def stream_zip(files):
+    """
+    Generate a ZIP of `files`, an iterable of (name, path, modified)
+    tuples, a piece at a time. Files are stored as they are (recordings
+    are already compressed), and large files use ZIP64, so this works in
+    constant memory however big the files are.
+    """
+    buf = StreamBuffer()
+    used = set()
+    # ZipFile writes sizes and CRCs after each file's data, as it can't
+    # seek back in `buf`.
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED,
+                         allowZip64=True) as zf:
+        for name, path, modified in files:
+            info = zipfile.ZipInfo(
+                unique_name(name, used),
+                date_time=modified.timetuple()[:6]
+            )
+            info.compress_type = zipfile.ZIP_STORED
+            size = os.path.getsize(path)
+            with open(path, 'rb') as src, \
+                    zf.open(info, 'w',
+                            force_zip64=size > zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    data = src.read(BUFFER_SIZE)
+                    if not data:
+                        break
+                    dst.write(data)
+                    yield buf.pop()
+            yield buf.pop()
+    # the central directory is written on close
+    yield buf.pop()
+
+
+def recording_files(room, recordings):
+    """
+    The files of `recordings` in `room` for `stream_zip`, skipping ones
+    that never started or have no file. Everything is looked up here, as a
+    list, so that nothing can fail once the ZIP has started streaming.
+    """
+    names = {
+        membership.participant_id: membership.get_display_name()
+        for membership in room.memberships.select_related('participant__user')
+    }
+    files = []
+    recordings = recordings.filter(started__isnull=False) \
+        .select_related('participant__user')
+    for rec in recordings:
+        path = rec.get_file_path()
+        if not os.path.exists(path):
+            continue
+        name = names.get(rec.participant_id)
+        if name is None:
+            # they've left the room
+            name = rec.participant.get_display_name()
+        files.append((rec.get_download_filename(name), path, rec.started))
+    return files
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recordings', '0009_auto_20261018_1200'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='assembly_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
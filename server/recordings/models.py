@@ -1,7 +1,22 @@
-from django.db import models
+from django.db import models, connection, close_old_connections
+from django.db.models.functions import Cast
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils.timezone import now
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from mimetypes import guess_extension
+from model_utils import Choices
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import threading
 import uuid
 
+logger = logging.getLogger(__name__)
+
 
 def format_duration(total_seconds, format='hms'):
     mins = total_seconds // 60
@@ -19,6 +34,32 @@ def format_duration(total_seconds, format='hms'):
             return f'{mins:02d}:{secs:02d}'
 
 
+class RecordingQuerySet(models.QuerySet):
+    def bulk_update(self, objs, fields):
+        """
+        Save `fields` of each of `objs` in a single UPDATE, setting each
+        field with a CASE on the primary key.
+        """
+        objs = list(objs)
+        if not objs or not fields:
+            return 0
+        values = {}
+        for name in fields:
+            field = self.model._meta.get_field(name)
+            case = models.Case(
+                *(
+                    models.When(pk=obj.pk, then=models.Value(
+                        getattr(obj, field.attname), output_field=field
+                    ))
+                    for obj in objs
+                ),
+                output_field=field
+            )
+            # so that Postgres doesn't have to guess the CASE's type
+            values[field.attname] = Cast(case, field)
+        return self.filter(pk__in=[obj.pk for obj in objs]).update(**values)
+
+
 class Recording(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     participant = models.ForeignKey('rooms.Participant',
@@ -37,17 +78,339 @@ class Recording(models.Model):
 
     url = models.URLField(blank=True, null=True)
 
+    objects = RecordingQuerySet.as_manager()
+
     @property
     def download_filename(self):
-        name = self.room.memberships.get(participant=self.participant).get_display_name()
-        duration = format_duration(self.duration)
-        date = self.started.strftime('%Y-%m-%d')
-        return f'{name} - {duration} - {date}.{self.file_ext}'
+        membership = self.room.memberships.filter(
+            participant=self.participant
+        ).first()
+        if membership is not None:
+            name = membership.get_display_name()
+        else:
+            # they've left the room
+            name = self.participant.get_display_name()
+        return self.get_download_filename(name)
+
+    def get_download_filename(self, name):
+        """The file name to download this recording as, if it's `name`'s."""
+        parts = [name, format_duration(self.duration)]
+        # recordings that never started may not have a date at all
+        date = self.started or self.ended
+        if date is not None:
+            parts.append(date.strftime('%Y-%m-%d'))
+        return ' - '.join(parts) + (self.file_ext or '')
 
     @property
     def file_ext(self):
         return guess_extension(self.type.split(';')[0])
 
+    @property
+    def file_name(self):
+        return f'{self.room_id}/{self.id.hex}{self.file_ext or ""}'
+
+    def get_file_path(self):
+        """Where the uploaded file for this recording is stored."""
+        return os.path.join(settings.FIRESIDE_RECORDINGS_ROOT, self.file_name)
+
+    def get_file_url(self):
+        return reverse('rooms:recording_download', kwargs={
+            'room_id': self.room_id,
+            'recording_id': self.id,
+        })
+
     class Meta:
         get_latest_by = 'started'
-        ordering = ['-id']
\ No newline at end of file
+        ordering = ['-id']
+
+
+class UploadError(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_assembly_executor():
+    """The thread pool that completed uploads are assembled in."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FIRESIDE_UPLOAD_ASSEMBLY_WORKERS
+            )
+    return _executor
+
+
+def copy_file_contents(src, dst, count):
+    """
+    Append `count` bytes from file object `src` (from its start) to `dst`,
+    copying in the kernel with copy_file_range or sendfile where possible,
+    so that the data never passes through Python. Returns the number of
+    bytes copied, which is less than `count` if `src` is shorter.
+    """
+    # anything buffered in dst has to be written before we write to its
+    # file descriptor directly
+    dst.flush()
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < count:
+                n = os.copy_file_range(src_fd, dst_fd, count - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            # e.g. across filesystems on older kernels
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                raise
+    try:
+        while copied < count:
+            n = os.sendfile(dst_fd, src_fd, copied, count - copied)
+            if n == 0:
+                break
+            copied += n
+        return copied
+    except (AttributeError, OSError):
+        if copied:
+            raise
+    while copied < count:
+        data = src.read(min(Upload.BUFFER_SIZE, count - copied))
+        if not data:
+            break
+        dst.write(data)
+        copied += len(data)
+    dst.flush()
+    return copied
+
+
+class Upload(models.Model):
+    """
+    A resumable, chunked HTTP upload of a recording's file.
+
+    Each chunk is streamed to its own file on disk as it arrives, and
+    re-sending a chunk simply replaces it, so retries are idempotent. Once
+    every chunk has arrived, they are joined into the recording's file in
+    the background.
+    """
+    STATUS = Choices(
+        ('u', 'uploading', 'Uploading'),
+        ('s', 'assembling', 'Assembling'),
+        ('c', 'complete', 'Complete'),
+        ('a', 'aborted', 'Aborted'),
+    )
+    #: size of the pieces a chunk is read and written in
+    BUFFER_SIZE = 64 * 1024
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recording = models.ForeignKey('Recording', related_name='uploads')
+    status = models.CharField(max_length=1, choices=STATUS,
+                              default=STATUS.uploading)
+    created = models.DateTimeField(auto_now_add=True)
+    completed = models.DateTimeField(blank=True, null=True)
+    assembly_started = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def chunk_dir(self):
+        return os.path.join(settings.FIRESIDE_UPLOAD_ROOT, self.id.hex)
+
+    def get_chunk_path(self, index):
+        return os.path.join(self.chunk_dir, f'{index:05d}')
+
+    def write_chunk(self, index, stream):
+        """
+        Stream chunk number `index` from the file-like `stream` to disk,
+        a piece at a time. Returns the chunk's ETag (its MD5).
+        """
+        if self.status != self.STATUS.uploading:
+            raise UploadError('Upload is not in progress.')
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        path = self.get_chunk_path(index)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+        md5 = hashlib.md5()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    data = stream.read(self.BUFFER_SIZE)
+                    if not data:
+                        break
+                    md5.update(data)
+                    f.write(data)
+                    size += len(data)
+            # atomically replace any earlier attempt at this chunk
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        etag = md5.hexdigest()
+        self.chunks.update_or_create(
+            index=index,
+            defaults={'size': size, 'etag': etag}
+        )
+        return etag
+
+    def check_chunks(self, etags):
+        """
+        Check that the chunks numbered by `etags` (a dict of chunk index to
+        ETag, as sent by the client) have all arrived intact, and that
+        there are no others. Returns the chunks in order.
+        """
+        if not isinstance(etags, dict) or not etags:
+            raise UploadError('No chunks were given.')
+        try:
+            expected = {int(k): v for k, v in etags.items()}
+        except (TypeError, ValueError):
+            raise UploadError('Chunks must be numbered.')
+        if sorted(expected) != list(range(len(expected))):
+            raise UploadError('Chunks must be numbered from 0.')
+        received = {chunk.index: chunk for chunk in self.chunks.all()}
+        for index, etag in expected.items():
+            if index not in received:
+                raise UploadError(f'Chunk {index} has not been received.')
+            if received[index].etag != etag:
+                raise UploadError(f'Chunk {index} does not match its ETag.')
+        unexpected = set(received) - set(expected)
+        if unexpected:
+            raise UploadError(f'Chunk {min(unexpected)} was not expected.')
+        return [received[index] for index in sorted(expected)]
+
+    def assemble(self, chunks):
+        """
+        Join `chunks` into the recording's file. Returns the file's size.
+        """
+        path = self.recording.get_file_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{self.id.hex}.part'
+        with open(tmp_path, 'wb') as out:
+            for chunk in chunks:
+                with open(self.get_chunk_path(chunk.index), 'rb') as f:
+                    if copy_file_contents(f, out, chunk.size) != chunk.size:
+                        raise UploadError(f'Chunk {chunk.index} is truncated.')
+        os.replace(tmp_path, path)
+        return sum(chunk.size for chunk in chunks)
+
+    @property
+    def is_assembly_stale(self):
+        """
+        Whether assembling started too long ago to still be running, e.g.
+        because the process doing it died.
+        """
+        if self.assembly_started is None:
+            return True
+        timeout = timedelta(seconds=settings.FIRESIDE_UPLOAD_ASSEMBLY_TIMEOUT)
+        return self.assembly_started < now() - timeout
+
+    def complete(self, etags):
+        """
+        Check that all the chunks have arrived, and start assembling them
+        in the background. Returns the URL the recording will have.
+        """
+        if self.status == self.STATUS.aborted:
+            raise UploadError('Upload was aborted.')
+        # already completing, e.g. because the client retried
+        if self.status == self.STATUS.complete:
+            return self.recording.get_file_url()
+        if self.status == self.STATUS.assembling:
+            if not self.is_assembly_stale:
+                return self.recording.get_file_url()
+        chunks = self.check_chunks(etags)
+        # unless someone else got there first
+        started = Upload.objects.filter(
+            id=self.id,
+            status=self.status,
+            assembly_started=self.assembly_started
+        ).update(status=self.STATUS.assembling, assembly_started=now())
+        if started:
+            self.status = self.STATUS.assembling
+            get_assembly_executor().submit(self.finish, chunks)
+        return self.recording.get_file_url()
+
+    def finish(self, chunks):
+        """
+        Assemble `chunks`, update the recording, clean up and let the room
+        know. Runs in the assembly thread pool.
+        """
+        close_old_connections()
+        try:
+            try:
+                filesize = self.assemble(chunks)
+                rec = self.recording
+                rec.filesize = filesize
+                rec.url = rec.get_file_url()
+                rec.save(update_fields=['filesize', 'url'])
+                completed = Upload.objects.filter(
+                    id=self.id,
+                    status=self.STATUS.assembling
+                ).update(status=self.STATUS.complete, completed=now())
+            except Exception:
+                logger.exception('Failed to assemble upload %s', self.id)
+                # leave the chunks, so that completing can be retried
+                Upload.objects.filter(
+                    id=self.id,
+                    status=self.STATUS.assembling
+                ).update(status=self.STATUS.uploading)
+                return
+            if not completed:
+                return
+            self.status = self.STATUS.complete
+            self.delete_chunks()
+            try:
+                self.notify_room(rec)
+            except Exception:
+                logger.exception(
+                    'Failed to announce completed upload %s', self.id
+                )
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    def notify_room(self, rec):
+        from recordings.serializers import RecordingSerializer
+        from rooms.models import Message
+        peer = rec.room.peers.for_participant(rec.participant)
+        rec.room.send(rec.room.message(
+            type=Message.TYPE.event,
+            payload={
+                'type': 'update_recording',
+                'data': RecordingSerializer(rec).data,
+            },
+            participant_id=rec.participant_id,
+            peer_id=peer.id if peer is not None else None
+        ))
+
+    def abort(self):
+        """
+        Abort the upload and delete its chunks. Raises UploadError if it's
+        already being assembled or complete.
+        """
+        aborted = Upload.objects.filter(
+            id=self.id,
+            status=self.STATUS.uploading
+        ).update(status=self.STATUS.aborted)
+        if not aborted:
+            self.refresh_from_db(fields=['status'])
+            if self.status != self.STATUS.aborted:
+                raise UploadError(
+                    f'Upload is {self.get_status_display().lower()}.'
+                )
+        self.status = self.STATUS.aborted
+        self.delete_chunks()
+
+    def delete_chunks(self):
+        self.chunks.all().delete()
+        shutil.rmtree(self.chunk_dir, ignore_errors=True)
+
+
+class UploadChunk(models.Model):
+    upload = models.ForeignKey('Upload', related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.BigIntegerField()
+    etag = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = ('upload', 'index')
@@ -0,0 +1,387 @@
+from datetime import datetime, timedelta
+import errno
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+from concurrent.futures import Future
+from django.urls import reverse
+from django.utils.timezone import now
+
+from recordings import models
+from recordings.export import stream_zip
+from recordings.models import Upload
+from rooms.models import Room
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def upload_settings(settings, tmpdir):
+    settings.FIRESIDE_HTTP_UPLOAD_ENABLED = True
+    settings.FIRESIDE_UPLOAD_ROOT = str(tmpdir.join('uploads'))
+    settings.FIRESIDE_RECORDINGS_ROOT = str(tmpdir.join('recordings'))
+    return settings
+
+
+class InlineExecutor:
+    """Runs submitted jobs straight away, in the calling thread."""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@pytest.fixture(autouse=True)
+def inline_assembly(mocker):
+    mocker.patch.object(models, 'get_assembly_executor',
+                        return_value=InlineExecutor())
+
+
+@pytest.fixture
+def logged_in_client(api_client, user):
+    api_client.force_login(user)
+    return api_client
+
+
+def upload_url(name, recording, **kwargs):
+    return reverse(f'rooms:{name}', kwargs={
+        'room_id': recording.room_id,
+        'recording_id': str(recording.id),
+        **kwargs
+    })
+
+
+def put_chunk(client, recording, upload_id, index, data):
+    url = client.post(
+        upload_url('upload_chunk', recording,
+                   upload_id=upload_id, index=index)
+    ).data
+    return client.put(url, data, content_type='application/octet-stream')
+
+
+@pytest.mark.usefixtures('upload_settings')
+class TestUpload:
+    def test_disabled(self, settings, logged_in_client, recording):
+        settings.FIRESIDE_HTTP_UPLOAD_ENABLED = False
+        response = logged_in_client.post(
+            upload_url('upload_initiate', recording)
+        )
+        assert response.status_code == 403
+
+    def test_only_own_recordings(self, api_client, user2, recording):
+        api_client.force_login(user2)
+        response = api_client.post(upload_url('upload_initiate', recording))
+        assert response.status_code == 404
+
+    def test_upload(self, mocker, logged_in_client, recording):
+        mocker.patch.object(Room, 'send')
+        response = logged_in_client.post(
+            upload_url('upload_initiate', recording)
+        )
+        upload_id = response.data['uploadId']
+        chunks = [os.urandom(200 * 1024), os.urandom(1000)]
+        etags = {}
+        for index, data in reversed(list(enumerate(chunks))):
+            response = put_chunk(
+                logged_in_client, recording, upload_id, index, data
+            )
+            assert response.status_code == 200
+            etags[index] = response['ETag'].strip('"')
+            assert etags[index] == hashlib.md5(data).hexdigest()
+
+        response = logged_in_client.post(
+            upload_url('upload_complete', recording, upload_id=upload_id),
+            {'etags': etags},
+            format='json'
+        )
+        assert response.status_code == 202
+        recording.refresh_from_db()
+        assert response.data == recording.url
+        assert recording.filesize == sum(len(c) for c in chunks)
+        with open(recording.get_file_path(), 'rb') as f:
+            assert f.read() == b''.join(chunks)
+        upload = Upload.objects.get(id=upload_id)
+        assert upload.status == Upload.STATUS.complete
+        assert not os.path.exists(upload.chunk_dir)
+        message = Room.send.call_args[0][0]
+        assert message.payload['type'] == 'update_recording'
+        assert message.payload['data']['filesize'] == recording.filesize
+
+    def test_complete_twice(self, mocker, logged_in_client, recording):
+        upload = recording.uploads.create()
+        response = put_chunk(
+            logged_in_client, recording, upload.id.hex, 0, b'data'
+        )
+        etags = {0: response['ETag'].strip('"')}
+        upload.status = Upload.STATUS.assembling
+        upload.assembly_started = now()
+        upload.save()
+        finish = mocker.patch.object(Upload, 'finish')
+        response = logged_in_client.post(
+            upload_url('upload_complete', recording, upload_id=upload.id.hex),
+            {'etags': etags},
+            format='json'
+        )
+        assert response.status_code == 202
+        assert response.data == recording.get_file_url()
+        assert not finish.called
+
+    def test_failed_assembly_can_be_retried(self, mocker, recording):
+        upload = recording.uploads.create()
+        etag = upload.write_chunk(0, io.BytesIO(b'data'))
+        mocker.patch.object(Upload, 'assemble', side_effect=OSError)
+        upload.complete({0: etag})
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.uploading
+
+    def test_retried_chunk_replaces_earlier(self, logged_in_client,
+                                            recording):
+        upload = recording.uploads.create()
+        put_chunk(logged_in_client, recording, upload.id.hex, 0, b'a' * 10)
+        response = put_chunk(
+            logged_in_client, recording, upload.id.hex, 0, b'b' * 5
+        )
+        assert upload.chunks.count() == 1
+        assert upload.chunks.get().size == 5
+        assert os.listdir(upload.chunk_dir) == ['00000']
+        assert response['ETag'].strip('"') == hashlib.md5(b'b' * 5).hexdigest()
+
+    def test_complete_missing_chunk(self, logged_in_client, recording):
+        upload = recording.uploads.create()
+        response = put_chunk(
+            logged_in_client, recording, upload.id.hex, 0, b'data'
+        )
+        response = logged_in_client.post(
+            upload_url('upload_complete', recording, upload_id=upload.id.hex),
+            {'etags': {0: response['ETag'].strip('"'), 1: 'abc'}},
+            format='json'
+        )
+        assert response.status_code == 400
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.uploading
+
+    def test_stale_assembly_restarted(self, recording):
+        upload = recording.uploads.create()
+        etag = upload.write_chunk(0, io.BytesIO(b'data'))
+        # as if the process assembling it had died
+        upload.status = Upload.STATUS.assembling
+        upload.assembly_started = now() - timedelta(hours=1)
+        upload.save()
+        upload.complete({0: etag})
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.complete
+
+    def test_failed_assembly_keeps_abort(self, recording):
+        upload = recording.uploads.create()
+        etag = upload.write_chunk(0, io.BytesIO(b'data'))
+
+        def assemble(chunks):
+            Upload.objects.filter(id=upload.id) \
+                .update(status=Upload.STATUS.aborted)
+            raise OSError
+
+        upload.assemble = assemble
+        upload.complete({0: etag})
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.aborted
+
+    def test_failed_announcement_keeps_upload_complete(self, mocker,
+                                                       recording):
+        upload = recording.uploads.create()
+        etag = upload.write_chunk(0, io.BytesIO(b'data'))
+        mocker.patch.object(Room, 'send', side_effect=RuntimeError)
+        upload.complete({0: etag})
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.complete
+        assert not upload.chunks.exists()
+
+    def test_abort_while_assembling(self, logged_in_client, recording):
+        upload = recording.uploads.create(
+            status=Upload.STATUS.assembling,
+            assembly_started=now()
+        )
+        response = logged_in_client.post(
+            upload_url('upload_abort', recording, upload_id=upload.id.hex)
+        )
+        assert response.status_code == 400
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.assembling
+
+    @pytest.mark.parametrize('etags', [{}, {'x': 'abc'}, ['abc']])
+    def test_complete_invalid_etags(self, recording, etags):
+        upload = recording.uploads.create()
+        upload.write_chunk(0, io.BytesIO(b'data'))
+        with pytest.raises(models.UploadError):
+            upload.complete(etags)
+
+    def test_complete_unexpected_chunk(self, recording):
+        upload = recording.uploads.create()
+        etag = upload.write_chunk(0, io.BytesIO(b'data'))
+        upload.write_chunk(1, io.BytesIO(b'more'))
+        with pytest.raises(models.UploadError):
+            upload.complete({0: etag})
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.uploading
+
+    def test_bad_chunk_token(self, logged_in_client):
+        response = logged_in_client.put(
+            reverse('rooms:upload_chunk_data', kwargs={'token': 'abc:def'}),
+            b'data',
+            content_type='application/octet-stream'
+        )
+        assert response.status_code == 404
+
+    def test_abort(self, logged_in_client, recording):
+        upload = recording.uploads.create()
+        put_chunk(logged_in_client, recording, upload.id.hex, 0, b'data')
+        response = logged_in_client.post(
+            upload_url('upload_abort', recording, upload_id=upload.id.hex)
+        )
+        assert response.status_code == 200
+        upload.refresh_from_db()
+        assert upload.status == Upload.STATUS.aborted
+        assert not os.path.exists(upload.chunk_dir)
+        response = logged_in_client.post(upload_url(
+            'upload_chunk', recording, upload_id=upload.id.hex, index=1
+        ))
+        assert response.status_code == 400
+
+
+@pytest.mark.parametrize('kernel_copy', [True, False])
+def test_copy_file_contents(tmpdir, mocker, kernel_copy):
+    if not kernel_copy:
+        mocker.patch('recordings.models.os.sendfile', side_effect=OSError,
+                     create=True)
+        mocker.patch('recordings.models.os.copy_file_range',
+                     side_effect=OSError(errno.ENOSYS, ''), create=True)
+    src_path = tmpdir.join('src')
+    src_path.write_binary(b'chunk')
+    with open(str(tmpdir.join('dst')), 'wb') as dst:
+        dst.write(b'before ')
+        with open(str(src_path), 'rb') as src:
+            # asks for more than there is
+            assert models.copy_file_contents(src, dst, 10) == 5
+        dst.write(b' after')
+    assert tmpdir.join('dst').read_binary() == b'before chunk after'
+
+
+@pytest.fixture
+def recording_file(upload_settings, recording):
+    path = recording.get_file_path()
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b'video')
+    return path
+
+
+class TestDownload:
+    def url(self, recording):
+        return reverse('rooms:recording_download', kwargs={
+            'room_id': recording.room_id,
+            'recording_id': str(recording.id),
+        })
+
+    def test_accel_redirect(self, logged_in_client, recording,
+                            recording_file):
+        response = logged_in_client.get(self.url(recording))
+        assert response.status_code == 200
+        assert response['X-Accel-Redirect'] == (
+            '/internal/recordings/' + recording.file_name
+        )
+        assert response['Content-Type'] == 'video/webm'
+        assert recording.download_filename.replace(' ', '%20') in \
+            response['Content-Disposition']
+        assert not response.content
+
+    def test_other_members_recording(self, api_client, user2, recording,
+                                     recording_file):
+        api_client.force_login(user2)
+        response = api_client.get(self.url(recording))
+        assert response.status_code == 200
+
+    def test_no_room_access(self, api_client, recording, recording_file):
+        response = api_client.get(self.url(recording))
+        assert response.status_code == 403
+
+    def test_unstarted(self, upload_settings, logged_in_client, room, user):
+        recording = room.recordings.create(
+            participant=user.participant, type='video/webm'
+        )
+        path = recording.get_file_path()
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'video')
+        name = user.participant.get_display_name()
+        assert recording.download_filename == f'{name} - 0m 0s.webm'
+        response = logged_in_client.get(self.url(recording))
+        assert response.status_code == 200
+
+    def test_no_file(self, upload_settings, logged_in_client, recording):
+        response = logged_in_client.get(self.url(recording))
+        assert response.status_code == 404
+
+    def test_without_accel(self, settings, logged_in_client, recording,
+                           recording_file):
+        settings.FIRESIDE_RECORDINGS_ACCEL_PREFIX = ''
+        response = logged_in_client.get(self.url(recording))
+        assert b''.join(response.streaming_content) == b'video'
+
+
+class TestExport:
+    def test_export(self, upload_settings, logged_in_client, recording,
+                    recording2, recording_file):
+        response = logged_in_client.get(reverse(
+            'rooms:recordings_export', kwargs={'room_id': recording.room_id}
+        ))
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/zip'
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content))
+        )
+        # recording2 has no file
+        assert archive.namelist() == [recording.download_filename]
+        assert archive.read(recording.download_filename) == b'video'
+
+    def test_unstarted_and_departed(self, upload_settings, logged_in_client,
+                                    room, user2, recording2):
+        unstarted = room.recordings.create(
+            participant=user2.participant, type='video/webm'
+        )
+        for rec in (recording2, unstarted):
+            path = rec.get_file_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'video')
+        room.memberships.filter(participant=user2.participant).delete()
+        response = logged_in_client.get(reverse(
+            'rooms:recordings_export', kwargs={'room_id': room.id}
+        ))
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content))
+        )
+        assert archive.namelist() == [
+            recording2.get_download_filename(
+                user2.participant.get_display_name()
+            )
+        ]
+
+    def test_no_room_access(self, api_client, recording):
+        response = api_client.get(reverse(
+            'rooms:recordings_export', kwargs={'room_id': recording.room_id}
+        ))
+        assert response.status_code == 403
+
+
+def test_stream_zip_names_are_unique(tmpdir):
+    path = tmpdir.join('a')
+    path.write(b'data')
+    modified = datetime(2018, 1, 1)
+    data = b''.join(stream_zip([
+        ('a.webm', str(path), modified),
+        ('a.webm', str(path), modified),
+    ]))
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.namelist() == ['a.webm', 'a (2).webm']
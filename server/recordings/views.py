@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.core import signing
+from django.http import (
+    FileResponse, HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+)
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+from urllib.parse import quote
+import os
+
+from rest_framework import status
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from rooms.views import HasRoomAccess
+from .export import recording_files, stream_zip
+from .models import Recording, Upload, UploadError
+
+CHUNK_URL_SALT = 'recordings.upload_chunk'
+
+
+class HttpUploadEnabled(BasePermission):
+    def has_permission(self, request, view):
+        return settings.FIRESIDE_HTTP_UPLOAD_ENABLED
+
+
+class UploadMixin:
+    permission_classes = (HttpUploadEnabled, HasRoomAccess)
+
+    def get_recording(self):
+        return get_object_or_404(
+            Recording,
+            id=self.kwargs['recording_id'],
+            room=self.request.room,
+            participant=self.request.participant,
+        )
+
+    def get_upload(self):
+        return get_object_or_404(
+            Upload,
+            id=self.kwargs['upload_id'],
+            recording=self.get_recording(),
+        )
+
+
+class InitiateUploadView(UploadMixin, APIView):
+    def post(self, request, **kwargs):
+        upload = self.get_recording().uploads.create()
+        return Response({'uploadId': upload.id.hex})
+
+
+class UploadChunkUrlView(UploadMixin, APIView):
+    """
+    Returns a signed URL to PUT a chunk to. The PUT itself is then
+    authorized by the signature alone, like a presigned S3 URL.
+    """
+    def post(self, request, index, **kwargs):
+        upload = self.get_upload()
+        if upload.status != Upload.STATUS.uploading:
+            return Response(
+                data={'error': 'Upload is not in progress.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        token = signing.dumps(
+            {'upload': upload.id.hex, 'index': int(index)},
+            salt=CHUNK_URL_SALT
+        )
+        return Response(
+            reverse('rooms:upload_chunk_data', kwargs={'token': token})
+        )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadChunkDataView(View):
+    """
+    Receives the body of a chunk, streaming it straight to disk so that
+    it is never held in memory in full.
+    """
+    def put(self, request, token):
+        try:
+            data = signing.loads(
+                token,
+                salt=CHUNK_URL_SALT,
+                max_age=settings.FIRESIDE_UPLOAD_CHUNK_URL_MAX_AGE
+            )
+        except signing.BadSignature:
+            raise Http404
+        upload = get_object_or_404(Upload, id=data['upload'])
+        try:
+            etag = upload.write_chunk(data['index'], request)
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        response = JsonResponse({'etag': etag})
+        response['ETag'] = f'"{etag}"'
+        return response
+
+
+class CompleteUploadView(UploadMixin, APIView):
+    def post(self, request, **kwargs):
+        upload = self.get_upload()
+        try:
+            url = upload.complete(request.data.get('etags') or {})
+        except UploadError as e:
+            return Response(
+                data={'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # the file is assembled in the background
+        return Response(url, status=status.HTTP_202_ACCEPTED)
+
+
+class AbortUploadView(UploadMixin, APIView):
+    def post(self, request, **kwargs):
+        try:
+            self.get_upload().abort()
+        except UploadError as e:
+            return Response(
+                data={'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(data='OK')
+
+
+class RecordingDownloadView(APIView):
+    """
+    Downloads a recording's file. Once access is checked, the transfer
+    itself is handed to nginx with X-Accel-Redirect, which also takes
+    care of Range requests, so large files can be resumed and scrubbed.
+    """
+    permission_classes = (HasRoomAccess,)
+
+    def get(self, request, recording_id, **kwargs):
+        rec = get_object_or_404(
+            Recording.objects.select_related('room'),
+            id=recording_id,
+            room=request.room,
+        )
+        path = rec.get_file_path()
+        if not os.path.exists(path):
+            raise Http404
+
+        prefix = settings.FIRESIDE_RECORDINGS_ACCEL_PREFIX
+        if prefix:
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = prefix + quote(rec.file_name)
+        else:
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Length'] = os.path.getsize(path)
+        response['Content-Type'] = rec.type.split(';')[0]
+        filename = rec.download_filename
+        fallback = filename.encode('ascii', 'replace').decode()
+        fallback = fallback.replace('"', '')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{fallback}"; '
+            f"filename*=UTF-8''{quote(filename)}"
+        )
+        return response
+
+
+class RecordingsExportView(APIView):
+    """
+    Downloads all of a room's recordings as one ZIP, which is generated
+    as it is sent.
+    """
+    permission_classes = (HasRoomAccess,)
+
+    def get(self, request, **kwargs):
+        files = recording_files(
+            request.room,
+            request.room.recordings.order_by('started')
+        )
+        response = StreamingHttpResponse(
+            stream_zip(files),
+            content_type='application/zip'
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="{request.room.id}.zip"'
+        # pass the pieces on as they are made
+        response['X-Accel-Buffering'] = 'no'
+        return response
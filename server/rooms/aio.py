@@ -0,0 +1,219 @@
+"""
+An asyncio worker for the room.* channels.
+
+Each message is handled in its own task, so one process can have many
+room operations in flight at once instead of idling on every round trip.
+Messages for the same room are still handled in the order they arrive.
+
+The hot path (relaying signalling, and ephemeral events like meter
+updates) is handled natively, with Redis calls going through a pooled
+asyncio client. Everything else (joining, leaving and any message that
+touches the database) runs the regular RoomConsumer in a bounded thread
+pool, as do the blocking channel layer and ORM calls.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import aioredis
+from channels import Channel, DEFAULT_CHANNEL_LAYER, channel_layers
+from channels.message import Message as ChannelMessage
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from . import cache, sharding
+from .consumers import RoomConsumer
+from .coalescing import get_event_coalescer
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+#: Events that can be handled without the database: they have no event
+#: handler and are never saved.
+ASYNC_EVENT_TYPES = {'update_meter', 'update_upload_progress'}
+
+
+async def create_redis_pool():
+    conf = settings.FIRESIDE_REDIS_CONF
+    return await aioredis.create_redis_pool(
+        (conf['host'], int(conf['port'])),
+        db=conf['db'],
+        minsize=1,
+        maxsize=settings.FIRESIDE_ASYNC_REDIS_POOL_SIZE,
+        encoding='utf-8',
+    )
+
+
+class AsyncPeerManager:
+    """
+    The parts of `PeerManager` that the async hot path needs, on a pooled
+    asyncio Redis client. Uses the same keys as `PeerManager`.
+    """
+    def __init__(self, redis, room_id):
+        self.redis = redis
+        self.room_id = room_id
+
+    @property
+    def _prefix(self):
+        return f'rooms:{self.room_id}'
+
+    async def get_channel_name(self, peer_id):
+        """The reply channel name of `peer_id`, or None if not connected."""
+        if not await self.redis.hexists(f'{self._prefix}:peers', peer_id):
+            return None
+        channel = await self.redis.hget(
+            f'{self._prefix}:peers:{peer_id}', 'channel'
+        )
+        return json.loads(channel) if channel else None
+
+
+class AsyncRoomWorker:
+    def __init__(self, channels, loop=None, channel_layer=None):
+        self.channels = list(channels)
+        self.loop = loop or asyncio.get_event_loop()
+        self.channel_layer = (
+            channel_layer or channel_layers[DEFAULT_CHANNEL_LAYER]
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.FIRESIDE_ASYNC_DB_THREADS
+        )
+        # receiving blocks a thread of its own, if the layer can't do it
+        # asynchronously
+        self.receive_executor = ThreadPoolExecutor(max_workers=1)
+        self.tasks = asyncio.Semaphore(
+            settings.FIRESIDE_ASYNC_MAX_TASKS, loop=self.loop
+        )
+        self.room_locks = weakref.WeakValueDictionary()
+        self.redis = None
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run blocking `fn` (ORM or channel layer calls) in the pool."""
+        def run():
+            close_old_connections()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                close_old_connections()
+        return await self.loop.run_in_executor(self.executor, run)
+
+    async def receive(self):
+        layer = self.channel_layer
+        if hasattr(layer, 'receive_async'):
+            return await layer.receive_async(self.channels)
+        return await self.loop.run_in_executor(
+            self.receive_executor,
+            partial(layer.receive, self.channels, block=True)
+        )
+
+    async def run(self):
+        self.redis = await create_redis_pool()
+        logger.info('Listening on %s', ', '.join(self.channels))
+        try:
+            while True:
+                channel, content = await self.receive()
+                if channel is None:
+                    continue
+                await self.tasks.acquire()
+                task = self.loop.create_task(self.handle(channel, content))
+                task.add_done_callback(lambda t: self.tasks.release())
+        finally:
+            self.redis.close()
+            await self.redis.wait_closed()
+
+    def get_room_lock(self, room_id):
+        lock = self.room_locks.get(room_id)
+        if lock is None:
+            lock = self.room_locks[room_id] = asyncio.Lock(loop=self.loop)
+        return lock
+
+    async def handle(self, channel, content):
+        # tasks are started in the order their messages arrived, and the
+        # lock is fair, so each room's messages are handled in order
+        async with self.get_room_lock(content.get('room_id')):
+            try:
+                if not await self.handle_async(channel, content):
+                    await self.run_blocking(
+                        self.dispatch, channel, content
+                    )
+            except Exception:
+                logger.exception('Error handling message on %s', channel)
+
+    def dispatch(self, channel, content):
+        """Handle the message with the regular, blocking consumer."""
+        RoomConsumer(ChannelMessage(content, channel, self.channel_layer))
+
+    async def get_room(self, room_id):
+        try:
+            # usually a hit in the in-process cache
+            return cache.rooms.peek(room_id)
+        except KeyError:
+            return await self.run_blocking(cache.rooms.get, room_id)
+
+    async def handle_async(self, channel, content):
+        """
+        Handle the message natively if it's on the hot path. Returns False
+        if it needs the regular consumer.
+        """
+        if channel.split('.')[1] != 'receive':
+            return False
+        peer_id = content.get('peer_id')
+        payload = content.get('payload')
+        if peer_id is None or not isinstance(payload, dict):
+            return False
+        if content.get('type') == Message.TYPE.signalling:
+            return await self.relay_signalling(content, peer_id, payload)
+        is_event = content.get('type') == Message.TYPE.event
+        if is_event and payload.get('type') in ASYNC_EVENT_TYPES:
+            return await self.send_event(content, peer_id, payload)
+        return False
+
+    async def relay_signalling(self, content, peer_id, payload):
+        if not payload.get('to'):
+            return False
+        room = await self.get_room(content['room_id'])
+        peers = AsyncPeerManager(self.redis, room.id)
+        channel_name = await peers.get_channel_name(payload['to'])
+        if channel_name is None:
+            # let the consumer report the error
+            return False
+        msg = room.message(
+            type=Message.TYPE.signalling,
+            payload=payload,
+            participant_id=content['participant_id'],
+            peer_id=peer_id,
+            timestamp=now(),
+        )
+        await self.run_blocking(
+            Channel(channel_name).send, {'text': msg.encode()}
+        )
+        return True
+
+    async def send_event(self, content, peer_id, payload):
+        room = await self.get_room(content['room_id'])
+        msg = room.message(
+            type=Message.TYPE.event,
+            payload=payload,
+            participant_id=content['participant_id'],
+            peer_id=peer_id,
+            timestamp=now(),
+        )
+        if settings.FIRESIDE_EVENT_COALESCE_INTERVAL:
+            get_event_coalescer().add(room, msg)
+        else:
+            await self.run_blocking(room.send, msg, save=False)
+        return True
+
+
+def room_channels(shards=None):
+    """The room.* channel names to listen on, for `shards` (or all)."""
+    if shards is None:
+        shards = range(settings.FIRESIDE_ROOM_SHARDS)
+    return [
+        sharding.shard_channel_name(kind, shard)
+        for kind in sharding.ROOM_CHANNEL_KINDS
+        for shard in shards
+    ]
@@ -6,4 +6,14 @@ class RoomsConfig(AppConfig):
     def ready(self):
         # room event handlers won't register unless imported
         # import here to avoid circular imports
-        from . import events
\ No newline at end of file
+        from . import events
+        # likewise for the cache invalidation signal receivers
+        from . import cache  # noqa: F401
+        from . import bootstrap  # noqa: F401
+        from . import roomconfig  # noqa: F401
+
+        # flush buffered messages and recording state on SIGTERM as well
+        from django.conf import settings
+        from .shutdown import install_sigterm_handler
+        if not settings.TEST:
+            install_sigterm_handler()
@@ -0,0 +1,121 @@
+"""
+The room-level part of the document `RoomView` bootstraps the client
+with: the room's owner, config and URLs. It's the same for everyone in
+the room, so it's cached in Redis and only rebuilt after it changes,
+rather than on every page load.
+
+Each room has a version number, which is bumped whenever the document is
+invalidated. A rebuilt document is only stored if the version hasn't
+changed while it was being built, so an invalidation racing with a
+rebuild can't leave a stale document cached.
+"""
+import json
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from fireside import redis_conn
+from .models import Room, RoomMembership, Participant
+
+SET_IF_VERSION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+_set_if_version = redis_conn.register_script(SET_IF_VERSION_SCRIPT)
+
+
+def _keys(room_id):
+    return f'rooms:{room_id}:bootstrap', f'rooms:{room_id}:bootstrap:version'
+
+
+def build_room_document(room):
+    owner_mem = room.owner_membership
+    return {
+        'modified': time.time(),
+        'room': {
+            'id': room.id,
+            'owner': {
+                'id': room.owner.id,
+                'name': owner_mem.get_display_name() if owner_mem else None,
+                'role': 'o',
+            },
+            'config': room.get_config(),
+        },
+        'urls': {
+            'socket': room.get_full_socket_url(),
+            'join': room.get_join_url(),
+            'messages': room.get_messages_url(),
+            'recordings': room.get_recordings_url(),
+            'config': room.get_config_url(),
+            'action': room.get_absolute_url() + 'actions/:name/',
+            'changeName': room.get_absolute_url() + 'participants/:uid/name/',
+        },
+    }
+
+
+def get_room_document(room_id):
+    """
+    The room-level bootstrap document of `room_id`, from the cache if
+    possible. Raises Room.DoesNotExist.
+    """
+    key, version_key = _keys(room_id)
+    document, version = redis_conn.mget(key, version_key)
+    if document is not None:
+        return json.loads(document)
+    room = Room.objects.select_related('owner__user').get(id=room_id)
+    document = build_room_document(room)
+    _set_if_version(
+        keys=[key, version_key],
+        args=[
+            version or '0',
+            json.dumps(document),
+            settings.FIRESIDE_ROOM_BOOTSTRAP_TTL,
+        ],
+    )
+    return document
+
+
+def invalidate_room_document(room_id):
+    """
+    Drop the cached document of `room_id` once the current transaction
+    commits (or straight away, outside of one). Until then, a rebuild
+    would still read the old data.
+    """
+    transaction.on_commit(partial(_invalidate, room_id))
+
+
+def _invalidate(room_id):
+    key, version_key = _keys(room_id)
+    pipe = redis_conn.pipeline()
+    pipe.incr(version_key)
+    # outlive any rebuild in progress
+    pipe.expire(version_key, settings.FIRESIDE_ROOM_BOOTSTRAP_TTL)
+    pipe.delete(key)
+    pipe.execute()
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    invalidate_room_document(instance.id)
+
+
+@receiver(post_save, sender=RoomMembership)
+@receiver(post_delete, sender=RoomMembership)
+def invalidate_membership_room(sender, instance, **kwargs):
+    invalidate_room_document(instance.room_id)
+
+
+@receiver(post_save, sender=Participant)
+def invalidate_owned_rooms(sender, instance, created, **kwargs):
+    # the owner's name may have changed
+    if not created:
+        for room_id in instance.owned_rooms.values_list('id', flat=True):
+            invalidate_room_document(room_id)
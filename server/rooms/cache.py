@@ -0,0 +1,245 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from redis.client import PubSubWorkerThread
+
+from fireside import redis_conn
+from .models import Room, Participant
+
+#: Redis pub/sub channel used to tell other processes to drop an object
+INVALIDATION_CHANNEL = 'rooms:cache:invalidate'
+
+#: All model caches, by model label
+caches = {}
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe LRU cache whose entries expire after `ttl`
+    seconds, with hit/miss counters for sizing.
+    """
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or settings.FIRESIDE_MODEL_CACHE_MAXSIZE
+        self.ttl = ttl or settings.FIRESIDE_MODEL_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """Get the value for `key`, calling `load()` to get it if needed."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = load()
+        self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def peek(self, key):
+        """
+        Get the value for `key` if it's cached, without loading it.
+        Raises KeyError otherwise.
+        """
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        raise KeyError(key)
+
+    def discard(self, key):
+        """Drop `key` from this process's cache."""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'size': len(self._items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ModelCache(LRUCache):
+    """
+    A cache of model instances keyed by primary key, which are
+    invalidated across worker processes through a Redis pub/sub channel
+    whenever the object is saved or deleted.
+    """
+    def __init__(self, model, maxsize=None, ttl=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.model = model
+        self.name = model._meta.label_lower
+        caches[self.name] = self
+
+    def get(self, pk):
+        """Get the object with primary key `pk`, from the DB if needed."""
+        start_listener()
+        return super().get(
+            str(pk),
+            lambda: self.model.objects.get(pk=pk)
+        )
+
+    def discard(self, pk):
+        super().discard(str(pk))
+
+    def add(self, obj):
+        """Cache `obj`, which was loaded some other way."""
+        start_listener()
+        self.set(str(obj.pk), obj)
+
+    def invalidate(self, pk):
+        """Drop `pk` from the cache in every process."""
+        self.discard(pk)
+        redis_conn.publish(INVALIDATION_CHANNEL, f'{self.name}:{pk}')
+
+
+class PeerChannelCache(LRUCache):
+    """
+    Maps peer ids to the reply channel names of their sockets, keyed by
+    `<room id>:<peer id>`. Entries are invalidated across worker processes
+    whenever their peer joins or leaves, so that signalling isn't relayed
+    to a dead channel until the entry expires.
+    """
+    name = 'peer_channel'
+
+    def __init__(self, maxsize=None, ttl=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        caches[self.name] = self
+
+    def get(self, room, peer_id):
+        """
+        Get the channel name for `peer_id` in `room`. Raises KeyError if
+        the peer isn't connected.
+        """
+        start_listener()
+        return super().get(
+            f'{room.id}:{peer_id}',
+            lambda: room.peers[peer_id].channel.name
+        )
+
+    def invalidate(self, room, peer_id):
+        """Drop `peer_id` in `room` from the cache in every process."""
+        key = f'{room.id}:{peer_id}'
+        self.discard(key)
+        redis_conn.publish(INVALIDATION_CHANNEL, f'{self.name}:{key}')
+
+
+class SessionCache(LRUCache):
+    """
+    Channel session data (see `rooms.channel_sessions`), by session key,
+    invalidated across worker processes whenever a session is saved.
+    """
+    name = 'channel_session'
+
+    def __init__(self, maxsize=None, ttl=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        caches[self.name] = self
+
+    def peek(self, key):
+        start_listener()
+        return super().peek(key)
+
+    def invalidate(self, key):
+        """Drop `key` from the cache in every process."""
+        self.discard(key)
+        redis_conn.publish(INVALIDATION_CHANNEL, f'{self.name}:{key}')
+
+
+class ParticipantIdCache(SessionCache):
+    """
+    Maps users (as `user.<id>`) and sessions (as `session.<key>`) to the
+    id of their participant, so that finding the participant for a
+    request or socket is usually a cache hit. Invalidated across worker
+    processes when the participant is deleted.
+    """
+    name = 'participant_id'
+
+
+def handle_invalidation(message):
+    # cache names have no colons, but keys may
+    name, _, pk = message['data'].partition(':')
+    if name in caches:
+        caches[name].discard(pk)
+
+
+def start_listener():
+    """
+    Start a background thread listening for invalidations from other
+    processes, if it isn't running already. Not started in tests, where
+    invalidation is only local.
+    """
+    global _listener
+    if _listener is not None or settings.TEST:
+        return
+    with _listener_lock:
+        if _listener is None:
+            pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: handle_invalidation})
+            # not run_in_thread, which starts the thread before we can
+            # make it a daemon
+            _listener = PubSubWorkerThread(pubsub, 1)
+            _listener.daemon = True
+            _listener.start()
+
+
+rooms = ModelCache(Room)
+participants = ModelCache(Participant)
+peer_channels = PeerChannelCache(
+    ttl=settings.FIRESIDE_PEER_CHANNEL_CACHE_TTL
+)
+channel_sessions = SessionCache(
+    maxsize=settings.FIRESIDE_CHANNEL_SESSION_CACHE_MAXSIZE,
+    ttl=settings.FIRESIDE_CHANNEL_SESSION_CACHE_TTL
+)
+
+participant_ids = ParticipantIdCache(
+    maxsize=settings.FIRESIDE_PARTICIPANT_ID_CACHE_MAXSIZE,
+    ttl=settings.FIRESIDE_PARTICIPANT_ID_CACHE_TTL
+)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_cached_instance(sender, instance, **kwargs):
+    caches[sender._meta.label_lower].invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Participant)
+def invalidate_participant_id(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        participant_ids.invalidate(f'user.{instance.user_id}')
+    if instance.session_key:
+        participant_ids.invalidate(f'session.{instance.session_key}')
@@ -0,0 +1,80 @@
+"""
+A session engine for channel sessions (CHANNEL_SESSION_ENGINE), storing
+each session as a Redis key with a TTL instead of a database row.
+
+Sessions are also cached in-process, so handling a websocket frame
+doesn't usually need a round trip at all; saving a session invalidates
+it in every other process.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import SessionBase, CreateError
+
+from fireside import redis_conn
+from . import cache
+
+KEY_PREFIX = 'channel_session:'
+
+
+class SessionStore(SessionBase):
+    def _redis_key(self, session_key):
+        return KEY_PREFIX + session_key
+
+    def load(self):
+        if self.session_key is None:
+            return {}
+        try:
+            return dict(cache.channel_sessions.peek(self.session_key))
+        except KeyError:
+            pass
+        data = redis_conn.get(self._redis_key(self.session_key))
+        if data is None:
+            self._session_key = None
+            return {}
+        session = self.decode(data)
+        cache.channel_sessions.set(self.session_key, session)
+        return dict(session)
+
+    def exists(self, session_key):
+        try:
+            cache.channel_sessions.peek(session_key)
+            return True
+        except KeyError:
+            return bool(redis_conn.exists(self._redis_key(session_key)))
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        session = self._get_session(no_load=must_create)
+        stored = redis_conn.set(
+            self._redis_key(self.session_key),
+            self.encode(session),
+            ex=settings.FIRESIDE_CHANNEL_SESSION_TTL,
+            nx=must_create,
+        )
+        if must_create and not stored:
+            raise CreateError
+        cache.channel_sessions.invalidate(self.session_key)
+        cache.channel_sessions.set(self.session_key, dict(session))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        redis_conn.delete(self._redis_key(session_key))
+        cache.channel_sessions.invalidate(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        # Redis expires the keys itself
+        pass
@@ -0,0 +1,104 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from channels import Group
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EventCoalescer:
+    """
+    Holds back high-frequency ephemeral events (see
+    `Room.should_coalesce_message`), keeping only the latest one per peer
+    and kind of update, and sends them to their rooms every `interval`
+    seconds from a background thread.
+
+    If `pack` is set, all of a room's pending events are sent in a single
+    frame, as a JSON array of messages.
+    """
+    def __init__(self, interval=None, pack=None, autostart=True):
+        self.interval = interval or settings.FIRESIDE_EVENT_COALESCE_INTERVAL
+        if pack is None:
+            pack = settings.FIRESIDE_EVENT_COALESCE_PACK
+        self.pack = pack
+        self.autostart = autostart
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def get_key(message):
+        """Events with the same key replace each other."""
+        event = message.payload
+        data = event.get('data') or {}
+        return (
+            message.peer_id or message.participant_id,
+            event['type'],
+            data.get('id'),
+            tuple(sorted(data)),
+        )
+
+    def add(self, room, message):
+        if self.autostart:
+            self.start()
+        key = self.get_key(message)
+        with self._lock:
+            if room.id not in self._pending:
+                self._pending[room.id] = (room, OrderedDict())
+            events = self._pending[room.id][1]
+            # move to the end, so events go out in order of latest update
+            events.pop(key, None)
+            events[key] = message
+
+    def flush(self):
+        """Send all pending events. Returns the number of frames sent."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        frames = 0
+        for room, events in pending.values():
+            messages = list(events.values())
+            if self.pack and len(messages) > 1:
+                Group(room.group_name).send({
+                    'text': '[' + ','.join(m.encode() for m in messages) + ']'
+                })
+                frames += 1
+            else:
+                for message in messages:
+                    room.send(message, save=False)
+                    frames += 1
+        return frames
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='EventCoalescer',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to send coalesced events')
+
+    def __len__(self):
+        return sum(len(events) for room, events in self._pending.values())
+
+
+_coalescer = None
+
+
+def get_event_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = EventCoalescer()
+    return _coalescer
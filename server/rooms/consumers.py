@@ -1,18 +1,41 @@
+import logging
+import time
+
 from django.utils.timezone import now
 from channels.generic.websockets import JsonWebsocketConsumer
 from channels.generic import BaseConsumer
 from channels import Channel, Group
-from .models import Room, Participant, Message
+from channels.sessions import channel_session
+from .models import Participant, Message
 from .utils import prioritize_h264
-import functools
+from . import cache
+from . import sharding
+from .tracing import Trace
+from fireside import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class RoomSocketConsumer(JsonWebsocketConsumer):
     http_user = True
 
+    def get_handler(self, message, **kwargs):
+        if message.channel.name == 'websocket.connect':
+            return super().get_handler(message, **kwargs)
+        # the user is only needed to connect; after that, everything we
+        # need is in the channel session, so don't look up the user for
+        # every frame
+        return channel_session(
+            getattr(self, self.method_mapping[message.channel.name])
+        )
+
     def get_participant(self, user, session):
         return Participant.objects.from_user_or_session(user, session)
 
+    def room_channel(self, kind):
+        """The room.`kind` channel for this socket's room's shard."""
+        return Channel(sharding.room_channel_name(kind, self.kwargs['id']))
+
     def connect(self, message, **kwargs):
         participant = self.get_participant(
             self.message.user, self.message.http_session
@@ -27,7 +50,7 @@ class RoomSocketConsumer(JsonWebsocketConsumer):
             message.channel_session.save()
 
             message.reply_channel.send({'accept': True})
-            Channel('room.join').send({
+            self.room_channel('join').send({
                 'reply_channel': message.content['reply_channel'],
                 'room_id': self.kwargs['id'],
                 'participant_id': self.message.channel_session['participant_id']
@@ -35,47 +58,95 @@ class RoomSocketConsumer(JsonWebsocketConsumer):
 
     def disconnect(self, message, **kwargs):
         if 'participant_id' in message.channel_session:
-            Channel('room.leave').send({
+            self.room_channel('leave').send({
                 'reply_channel': message.content['reply_channel'],
                 'room_id': self.kwargs['id'],
                 'participant_id': self.message.channel_session['participant_id'],
                 'peer_id': self.message.channel_session['peer_id']
             })
 
+    def relay_signalling(self, decoded, trace=None):
+        """
+        Send a signalling message straight to the target peer's channel,
+        skipping the room.receive hop. Returns False if it can't, e.g.
+        because we haven't joined yet or the target isn't connected, in
+        which case the message should go through RoomConsumer as normal.
+        """
+        peer_id = self.message.channel_session.get('peer_id')
+        payload = decoded['payload']
+        if peer_id is None or not isinstance(payload, dict):
+            return False
+        room = RoomConsumer.get_room(self.kwargs['id'])
+        try:
+            channel_name = cache.peer_channels.get(room, payload['to'])
+        except KeyError:
+            return False
+        msg = Message(
+            type=Message.TYPE.signalling,
+            payload=payload,
+            participant_id=self.message.channel_session['participant_id'],
+            peer_id=peer_id,
+            timestamp=now(),
+        )
+        Channel(channel_name).send({'text': msg.encode()})
+        if trace is not None:
+            trace.stamp('fanout')
+            trace.finish(Message.get_metric_labels(msg.type, payload))
+        return True
+
     def receive(self, text, **kwargs):
+        trace = Trace.start()
         decoded = Message.decode_message_dict(text)
+        if decoded['type'] == Message.TYPE.signalling:
+            if self.relay_signalling(decoded, trace):
+                return
+        if trace is not None:
+            decoded['trace'] = trace.to_content()
         decoded['reply_channel'] = self.message.content['reply_channel']
         decoded['room_id'] = self.kwargs['id']
         decoded['participant_id'] = \
             self.message.channel_session['participant_id']
-        print(decoded)
-        Channel('room.receive').send(decoded)
+        decoded['peer_id'] = self.message.channel_session.get('peer_id')
+        logger.debug('Received %s', decoded)
+        self.room_channel('receive').send(decoded)
 
 
 class RoomConsumer(BaseConsumer):
     channel_session = True
-    method_mapping = {
-        'room.join': 'join',
-        'room.leave': 'leave',
-        'room.receive': 'receive'
-    }
+    #: room.join, room.leave and room.receive, for every shard
+    method_mapping = sharding.method_mapping()
 
     @classmethod
-    @functools.lru_cache(maxsize=None)
     def get_room(cls, id):
-        return Room.objects.get(id=id)
+        return cache.rooms.get(id)
 
     @classmethod
-    @functools.lru_cache(maxsize=None)
     def get_participant(cls, id):
-        return Participant.objects.get(id=id)
+        return cache.participants.get(id)
 
     def dispatch(self, message, **kwargs):
+        start = time.perf_counter()
         self.room = self.get_room(message.content['room_id'])
         self.participant = self.get_participant(
             message.content['participant_id']
         )
-        return super().dispatch(message, **kwargs)
+        try:
+            return super().dispatch(message, **kwargs)
+        finally:
+            self.record_metrics(message, time.perf_counter() - start)
+
+    def record_metrics(self, message, duration):
+        # room.receive, room.join or room.leave, whatever the shard
+        handler = message.channel.name.split('.')[1]
+        content = message.content
+        if handler == 'receive' and content.get('type') in Message.TYPE:
+            labels = Message.get_metric_labels(
+                content['type'], content.get('payload')
+            )
+            metrics.messages_received.inc(**labels)
+        else:
+            labels = {'type': '', 'event_type': ''}
+        metrics.consumer_latency.observe(duration, handler=handler, **labels)
 
     def receive(self, message, **kwargs):
         if message.content['type'] in Message.TYPE:
@@ -86,11 +157,19 @@ class RoomConsumer(BaseConsumer):
                 peer_id=message.channel_session.get('peer_id', None),
                 timestamp=now(),
             )
+            msg.trace = Trace.from_content(message.content)
+            if msg.trace is not None:
+                msg.trace.stamp('dequeued')
 
-            return getattr(self, msg.get_type_display())(
+            result = getattr(self, msg.get_type_display())(
                 msg,
                 **msg.payload
             )
+            if msg.trace is not None:
+                msg.trace.finish(
+                    Message.get_metric_labels(msg.type, msg.payload)
+                )
+            return result
 
     def event(self, message, **kwargs):
         self.room.receive_event(message)
@@ -100,7 +179,9 @@ class RoomConsumer(BaseConsumer):
             self.participant,
             channel_name=self.message.reply_channel.name
         )
-        print(peer_id)
+        # in case the peer was connected on another channel before
+        cache.peer_channels.invalidate(self.room, peer_id)
+        logger.debug('Peer %s joined room %s', peer_id, self.room.id)
         mem = self.room.memberships.get(participant=self.participant)
         initial_data = self.room.get_initial_data()
         initial_data['self'] = {
@@ -126,6 +207,7 @@ class RoomConsumer(BaseConsumer):
             message['peer_id'],
             participant=self.participant
         )
+        cache.peer_channels.invalidate(self.room, message['peer_id'])
         Group(self.room.group_name).discard(self.message.reply_channel)
 
     def signalling(self, message, to, **data):
@@ -133,7 +215,7 @@ class RoomConsumer(BaseConsumer):
         try:
             self.room.send(message, to_peer_id=to)
         except KeyError:
-            self.room.send(self.room.message(type=Message.TYPE.message, payload={
+            self.room.send(self.room.message(type=Message.TYPE.event, payload={
                 'type': 'signalling_error',
                 'data': {'message': f'Peer {to} does not exist'}
             }), to_peer_id=message.peer_id)
@@ -0,0 +1,81 @@
+from .models import Room, Participant
+
+
+class RoomContext:
+    """
+    What handling a request for a room needs to know about it: the room
+    and its owner, the participant making the request, and their and the
+    owner's memberships.
+
+    Loaded once per request with `for_request`, and shared by the
+    permission checks, the view and its serializers.
+    """
+    def __init__(self, room, participant, memberships):
+        self.room = room
+        self.participant = participant
+        self._memberships = memberships
+
+    @classmethod
+    def load(cls, room_id, participant=None):
+        """
+        Load the context of `room_id` for `participant` (which may be
+        None), in two queries. Raises Room.DoesNotExist.
+        """
+        room = Room.objects.select_related('owner__user').get(id=room_id)
+        participant_ids = {room.owner_id}
+        if participant is not None:
+            participant_ids.add(participant.id)
+        memberships = {}
+        for membership in room.memberships.filter(
+            participant_id__in=participant_ids
+        ):
+            # save looking these up again
+            membership.room = room
+            if membership.participant_id == room.owner_id:
+                membership.participant = room.owner
+            else:
+                membership.participant = participant
+            memberships[membership.participant_id] = membership
+        return cls(room, participant, memberships)
+
+    @classmethod
+    def for_request(cls, request, room_id):
+        """
+        The context of `room_id` for `request`, or None if the room doesn't
+        exist. Kept on the request, so it's only loaded once.
+        """
+        # DRF wraps the HttpRequest, so keep it on that
+        http_request = getattr(request, '_request', request)
+        contexts = http_request.__dict__.setdefault('_room_contexts', {})
+        if room_id not in contexts:
+            try:
+                participant = Participant.objects.from_request(request)
+            except Participant.DoesNotExist:
+                participant = None
+            try:
+                contexts[room_id] = cls.load(room_id, participant)
+            except Room.DoesNotExist:
+                contexts[room_id] = None
+        return contexts[room_id]
+
+    @property
+    def membership(self):
+        """The participant's membership, or None if they haven't joined."""
+        if self.participant is None:
+            return None
+        return self._memberships.get(self.participant.id)
+
+    @property
+    def owner_membership(self):
+        """The owner's membership, or None if they haven't joined yet."""
+        return self._memberships.get(self.room.owner_id)
+
+    @property
+    def is_member(self):
+        return self.membership is not None
+
+    @property
+    def is_admin(self):
+        if self.participant is None:
+            return False
+        return self.room.is_admin(self.participant)
@@ -1,4 +1,7 @@
 from .utils import register_room_event_handler
+from .livestate import (
+    LIVE_FIELDS, get_recording_state_flusher, parse_recording_state
+)
 import recordings.serializers
 
 @register_room_event_handler
@@ -17,12 +20,36 @@ def update_status(event, message, room):
             onboarding_complete=event['data']['onboarding_complete']
         )
 
+
+@register_room_event_handler
+def update_recording(event, message, room):
+    # while recording, the continuously changing fields only go to Redis,
+    # and are written to the database periodically by the flusher
+    data = event['data']
+    update = recordings.serializers.RecordingSerializer(
+        data=data, partial=True
+    )
+    state = {k: data[k] for k in LIVE_FIELDS if k in data}
+    if 'id' in data and state and update.is_valid():
+        room.peers.set_recording_state(
+            data['id'], message.participant_id, state
+        )
+        get_recording_state_flusher().start()
+
+
 @register_room_event_handler
 def stop_recording(event, message, room):
     update = recordings.serializers.RecordingSerializer(data=event['data'], partial=True)
     if update.is_valid():
-        if room.recordings.filter(
+        # flush the live state along with the final update
+        participant_id, state = room.peers.pop_recording_state(
+            event['data']['id']
+        )
+        values = {}
+        if participant_id == message.participant_id:
+            values.update(parse_recording_state(state))
+        values.update(update.validated_data)
+        room.recordings.filter(
             id=event['data']['id'],
-            participant=message.participant
-        ).exists():
-            room.recordings.filter(id=event['data']['id']).update(**update.validated_data)
\ No newline at end of file
+            participant_id=message.participant_id
+        ).update(**values)
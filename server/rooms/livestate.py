@@ -0,0 +1,215 @@
+import atexit
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from fireside import redis_conn
+
+logger = logging.getLogger(__name__)
+
+#: The recording fields that change continuously while recording, and so
+#: are kept in Redis until they're flushed.
+LIVE_FIELDS = ('duration', 'filesize', 'is_paused', 'last_paused')
+
+#: Sorted set of 'room_id:recording_id' for recordings with unflushed live
+#: state, scored by the number of updates to it, so that a flush can tell
+#: whether a recording was updated again after it read its state.
+DIRTY_RECORDINGS_KEY = 'rooms:recordings:dirty'
+
+#: Clears the dirty markers of recordings whose state has been saved, unless
+#: they have been updated since.
+#: KEYS: dirty recordings sorted set
+#: ARGV: member, score read, member, score read...
+#: Returns the number of markers cleared.
+CLEAR_DIRTY_SCRIPT = """
+local cleared = 0
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if tonumber(score) == tonumber(ARGV[i + 1]) then
+        cleared = cleared + redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return cleared
+"""
+_clear_dirty = redis_conn.register_script(CLEAR_DIRTY_SCRIPT)
+
+
+def decode_recording_state(raw):
+    """
+    Decode a live state hash from Redis into (participant_id, state), where
+    `state` holds the raw field values as sent by the client.
+    """
+    participant_id = raw.get('participant_id')
+    return (
+        int(participant_id) if participant_id else None,
+        {k: json.loads(v) for k, v in raw.items() if k != 'participant_id'}
+    )
+
+
+def parse_recording_state(state):
+    """Validate raw live `state`, returning model field values."""
+    from recordings.serializers import RecordingSerializer
+    serializer = RecordingSerializer(data=state, partial=True)
+    if not serializer.is_valid():
+        return {}
+    return {
+        k: v for k, v in serializer.validated_data.items()
+        if k in LIVE_FIELDS
+    }
+
+
+def encode_recording_state(values):
+    """
+    The inverse of `parse_recording_state`: raw live state, as a client
+    would send it, for the model field `values`.
+    """
+    from recordings.serializers import RecordingSerializer
+    fields = RecordingSerializer().fields
+    return {
+        k: None if v is None else fields[k].to_representation(v)
+        for k, v in values.items()
+    }
+
+
+def apply_recording_states(recordings, states):
+    """
+    Overlay live `states` (from `PeerManager.get_recording_states`) on
+    `recordings`, so they're up to date without waiting for a flush.
+    """
+    for rec in recordings:
+        participant_id, state = states.get(str(rec.id), (None, None))
+        if state and participant_id == rec.participant_id:
+            for field, value in parse_recording_state(state).items():
+                setattr(rec, field, value)
+
+
+class RecordingStateFlusher:
+    """
+    Writes the live state of active recordings from Redis to the database
+    every `interval` seconds, from a background thread, so that while
+    recording, Postgres only sees a write every so often instead of one
+    per update. Recordings are flushed in batches of `batch_size`, with
+    one UPDATE per set of fields changed.
+
+    A recording's state is also flushed as soon as it's stopped (see the
+    stop_recording event handler), and everything is flushed when the
+    process exits, including on SIGTERM (see `install_sigterm_handler`).
+    State that a process left unflushed, e.g. because it was killed, is
+    flushed as soon as another flusher starts.
+    """
+    def __init__(self, interval=None, batch_size=500):
+        self.interval = interval or settings.FIRESIDE_RECORDING_FLUSH_INTERVAL
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def flush(self):
+        """
+        Save all unflushed live state. Returns the number saved.
+
+        Recordings are only marked clean once their state is saved, so if
+        saving fails, or the process dies, the next flush picks them up.
+        """
+        with self._flush_lock:
+            saved = 0
+            # only go through what's dirty now, so that recordings that keep
+            # being updated can't keep this going
+            pending = redis_conn.zcard(DIRTY_RECORDINGS_KEY)
+            for _ in range(0, pending, self.batch_size):
+                dirty = redis_conn.zrange(
+                    DIRTY_RECORDINGS_KEY, 0, self.batch_size - 1,
+                    withscores=True,
+                )
+                if not dirty:
+                    break
+                pipe = redis_conn.pipeline(transaction=False)
+                for member, _ in dirty:
+                    room_id, recording_id = member.split(':', 1)
+                    pipe.hgetall(f'rooms:{room_id}:recordings:{recording_id}')
+                states = {}
+                for (member, _), raw in zip(dirty, pipe.execute()):
+                    if raw:
+                        room_id, recording_id = member.split(':', 1)
+                        states[recording_id] = (
+                            room_id, *decode_recording_state(raw)
+                        )
+                saved += self.save(states)
+                _clear_dirty(
+                    keys=[DIRTY_RECORDINGS_KEY],
+                    args=[x for member_score in dirty for x in member_score],
+                )
+            return saved
+
+    def save(self, states):
+        """
+        Save `states`, a dict mapping recording ids to
+        (room_id, participant_id, state). State for recordings that don't
+        belong to that room and participant is ignored.
+        """
+        from recordings.models import Recording
+        parsed = {}
+        for recording_id, entry in states.items():
+            try:
+                parsed[uuid.UUID(recording_id)] = entry
+            except ValueError:
+                pass
+        if not parsed:
+            return 0
+        close_old_connections()
+        owners = {
+            id: (room_id, participant_id)
+            for id, room_id, participant_id in Recording.objects.filter(
+                id__in=list(parsed)
+            ).values_list('id', 'room_id', 'participant_id')
+        }
+        by_fields = defaultdict(list)
+        for recording_id, (room_id, participant_id, state) in parsed.items():
+            if owners.get(recording_id) != (room_id, participant_id):
+                continue
+            values = parse_recording_state(state)
+            if values:
+                by_fields[frozenset(values)].append(
+                    Recording(id=recording_id, **values)
+                )
+        with transaction.atomic():
+            for fields, recs in by_fields.items():
+                Recording.objects.bulk_update(recs, fields)
+        return sum(len(recs) for recs in by_fields.values())
+
+    def start(self):
+        if self._thread is not None or settings.TEST:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='RecordingStateFlusher',
+                    daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Recording state flush failed')
+            time.sleep(self.interval)
+
+
+_flusher = None
+
+
+def get_recording_state_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = RecordingStateFlusher()
+    return _flusher
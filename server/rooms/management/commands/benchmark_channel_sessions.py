@@ -0,0 +1,52 @@
+import time
+import uuid
+
+from channels.sessions import session_for_reply_channel
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+def handle_frame(reply_channel):
+    """What channel_session does for each websocket frame."""
+    session = session_for_reply_channel(reply_channel)
+    session.exists(session.session_key)
+    return session.get('participant_id'), session.get('peer_id')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the database and Redis channel session engines, by the '
+        'time and database queries needed to load the session for a '
+        'websocket frame.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        n = options['number']
+        for engine in [
+            'django.contrib.sessions.backends.db',
+            'rooms.channel_sessions',
+        ]:
+            with override_settings(CHANNEL_SESSION_ENGINE=engine):
+                reply_channel = f'websocket.send!{uuid.uuid4().hex}'
+                # as on connecting and joining
+                session = session_for_reply_channel(reply_channel)
+                if not session.exists(session.session_key):
+                    session.save(must_create=True)
+                session['participant_id'] = 1
+                session['peer_id'] = uuid.uuid4().hex
+                session.save()
+
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for i in range(n):
+                        handle_frame(reply_channel)
+                    elapsed = time.perf_counter() - start
+                session.delete()
+            self.stdout.write(
+                f'{engine:>36}: {elapsed / n * 1e6:8.1f} us/frame, '
+                f'{len(queries) / n:.1f} queries/frame'
+            )
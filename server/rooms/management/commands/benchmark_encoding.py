@@ -0,0 +1,63 @@
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from rooms.models import Message
+from rooms.serializers import MessageSerializer
+
+
+def encode_with_serializer(message):
+    """The original, DRF-based implementation of Message.encode."""
+    data = MessageSerializer(message).data
+    data['participant_id'] = data.pop('uid')
+    return Message.encode_message_dict(data)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare Message.encode against encoding through MessageSerializer, '
+        'using a typical ICE candidate signalling message.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        message = Message(
+            room_id='ZZZZZZ',
+            type=Message.TYPE.signalling,
+            participant_id=1,
+            peer_id=uuid.uuid4().hex,
+            timestamp=now(),
+            payload={
+                'to': uuid.uuid4().hex,
+                'type': 'candidate',
+                'payload': {
+                    'candidate': (
+                        'candidate:842163049 1 udp 1677729535 '
+                        '203.0.113.7 54400 typ srflx raddr 10.0.0.2 '
+                        'rport 54400 generation 0 ufrag EsAw '
+                        'network-cost 50'
+                    ),
+                    'sdpMid': 'audio',
+                    'sdpMLineIndex': 0,
+                },
+            },
+        )
+        assert message.encode() == encode_with_serializer(message)
+
+        n = options['number']
+        results = {}
+        for name, f in [
+            ('serializer', lambda: encode_with_serializer(message)),
+            ('encode', message.encode),
+        ]:
+            results[name] = min(timeit.repeat(f, number=n, repeat=3)) / n
+            self.stdout.write(
+                f'{name:>12}: {results[name] * 1e6:8.2f} us/message'
+            )
+        self.stdout.write(
+            f'     speedup: {results["serializer"] / results["encode"]:.1f}x'
+        )
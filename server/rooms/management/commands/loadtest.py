@@ -0,0 +1,224 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+from rooms.models import Room, Participant, Message
+
+
+def percentile(values, p):
+    """The `p`th percentile of the sorted list `values`."""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Stats:
+    """Message counts and latencies (in seconds), by message type."""
+    def __init__(self):
+        self.sent = defaultdict(int)
+        self.received = defaultdict(int)
+        self.latencies = defaultdict(list)
+
+    def record(self, name, latency):
+        self.received[name] += 1
+        self.latencies[name].append(latency)
+
+
+class LoadTestPeer:
+    """A simulated participant, connecting to a room's socket."""
+    def __init__(self, test, room, participant, session_key):
+        self.test = test
+        self.room = room
+        self.participant = participant
+        self.session_key = session_key
+        self.peer_id = None
+        self.socket = None
+
+    @property
+    def stats(self):
+        return self.test.stats
+
+    async def send(self, name, type, payload):
+        payload['sent'] = time.perf_counter()
+        self.stats.sent[name] += 1
+        await self.socket.send(json.dumps({'t': type, 'p': payload}))
+
+    async def connect(self):
+        url = self.test.url + self.room.get_socket_url()
+        connected = time.perf_counter()
+        self.socket = await self.test.websockets.connect(
+            url,
+            extra_headers={'Cookie': f'sessionid={self.session_key}'}
+        )
+        self.stats.sent['join'] += 1
+        while self.peer_id is None:
+            msg = json.loads(await self.socket.recv())
+            if msg['t'] == Message.TYPE.join:
+                self.peer_id = msg['p']['self']['peer_id']
+                self.stats.record('join', time.perf_counter() - connected)
+        self.test.peer_ids[self.room.id].append(self.peer_id)
+
+    async def listen(self):
+        async for text in self.socket:
+            msg = json.loads(text)
+            now = time.perf_counter()
+            payload = msg['p']
+            if msg['t'] == Message.TYPE.signalling:
+                self.stats.record('signalling', now - payload['sent'])
+            elif msg['t'] == Message.TYPE.event and 'sent' in payload:
+                self.stats.record(payload['type'], now - payload['sent'])
+            elif msg['t'] == Message.TYPE.leave:
+                left = self.test.left.get(payload['id'])
+                if left is not None:
+                    self.stats.record('leave', now - left)
+
+    async def run_signalling(self, burst):
+        for peer_id in self.test.peer_ids[self.room.id]:
+            if peer_id == self.peer_id:
+                continue
+            for i in range(burst):
+                await self.send('signalling', Message.TYPE.signalling, {
+                    'to': peer_id,
+                    'type': 'candidate',
+                    'candidate': f'candidate:{i} 1 udp 1677729535 '
+                                 '203.0.113.7 54400 typ srflx',
+                })
+
+    async def run_status_updates(self, count, interval):
+        for i in range(count):
+            await self.send('update_status', Message.TYPE.event, {
+                'type': 'update_status',
+                'data': {
+                    'disk_usage': {'usage': i * 1024 ** 2, 'quota': 1024 ** 3},
+                },
+            })
+            await self.send('update_meter', Message.TYPE.event, {
+                'type': 'update_meter',
+                'data': {'level': (i % 10) / 10},
+            })
+            await asyncio.sleep(interval)
+
+    async def leave(self):
+        self.test.left[self.peer_id] = time.perf_counter()
+        self.stats.sent['leave'] += 1
+        await self.socket.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate rooms full of peers joining, signalling, sending status '
+        'updates and leaving against a running server, and report '
+        'throughput and latency per message type. Needs the websockets '
+        'package, and access to the same database as the server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://localhost:8000')
+        parser.add_argument('--rooms', type=int, default=10)
+        parser.add_argument('--peers', type=int, default=4,
+                            help='Peers per room')
+        parser.add_argument('--signalling-burst', type=int, default=20,
+                            help='Signalling messages to send to each peer')
+        parser.add_argument('--status-updates', type=int, default=20)
+        parser.add_argument('--status-interval', type=float, default=0.1,
+                            help='Seconds between status updates')
+        parser.add_argument('--drain', type=float, default=2,
+                            help='Seconds to wait for messages to arrive')
+        parser.add_argument('--keep', action='store_true',
+                            help="Don't delete the test rooms afterwards")
+
+    def setup(self, num_rooms, num_peers):
+        """Create rooms and participants, each with their own session."""
+        peers = []
+        for i in range(num_rooms):
+            room = None
+            for j in range(num_peers):
+                session = SessionStore()
+                session.create()
+                participant = Participant.objects.create(
+                    session_key=session.session_key,
+                    name=f'Load test {uuid.uuid4().hex[:6]}'
+                )
+                if room is None:
+                    room = Room.objects.create_with_owner(participant)
+                room.memberships.create(
+                    participant=participant,
+                    role='o' if participant == room.owner else 'g'
+                )
+                peers.append(
+                    LoadTestPeer(self, room, participant, session.session_key)
+                )
+        return peers
+
+    def teardown(self, peers):
+        rooms = {peer.room.id for peer in peers}
+        for peer in peers:
+            SessionStore(session_key=peer.session_key).delete()
+        Room.objects.filter(id__in=rooms).delete()
+        Participant.objects.filter(
+            id__in=[peer.participant.id for peer in peers]
+        ).delete()
+
+    async def run(self, peers, options):
+        started = time.perf_counter()
+        await asyncio.gather(*[peer.connect() for peer in peers])
+        listeners = [asyncio.ensure_future(peer.listen()) for peer in peers]
+        await asyncio.gather(*[
+            peer.run_signalling(options['signalling_burst'])
+            for peer in peers
+        ])
+        await asyncio.gather(*[
+            peer.run_status_updates(
+                options['status_updates'],
+                options['status_interval']
+            ) for peer in peers
+        ])
+        await asyncio.sleep(options['drain'])
+        await asyncio.gather(*[peer.leave() for peer in peers])
+        await asyncio.wait(listeners, timeout=options['drain'])
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        self.stdout.write(
+            f'{"type":<24}{"sent":>8}{"recv":>8}{"recv/s":>10}'
+            f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+        )
+        for name in sorted(set(self.stats.sent) | set(self.stats.received)):
+            latencies = sorted(self.stats.latencies[name])
+            row = f'{name:<24}{self.stats.sent[name]:>8}' \
+                f'{self.stats.received[name]:>8}' \
+                f'{self.stats.received[name] / elapsed:>10.1f}'
+            for p in (50, 95, 99):
+                value = percentile(latencies, p)
+                row += f'{value * 1000:>10.1f}' if value is not None \
+                    else f'{"-":>10}'
+            self.stdout.write(row)
+        self.stdout.write(f'\nTotal time: {elapsed:.2f}s')
+
+    def handle(self, *args, **options):
+        try:
+            import websockets
+        except ImportError:
+            raise CommandError('The websockets package is required.')
+        self.websockets = websockets
+        self.url = options['url'].rstrip('/')
+        self.stats = Stats()
+        self.peer_ids = defaultdict(list)
+        self.left = {}
+
+        peers = self.setup(options['rooms'], options['peers'])
+        try:
+            loop = asyncio.get_event_loop()
+            elapsed = loop.run_until_complete(self.run(peers, options))
+        finally:
+            if not options['keep']:
+                self.teardown(peers)
+        self.report(elapsed)
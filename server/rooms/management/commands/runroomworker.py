@@ -0,0 +1,27 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from rooms.aio import AsyncRoomWorker, room_channels
+
+
+class Command(BaseCommand):
+    help = (
+        'Run an asyncio worker for the room.* channels, handling many '
+        'messages concurrently. Run regular workers (runworker '
+        '--exclude-channels=room.*) for the websocket channels.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard', type=int, action='append', dest='shards',
+            help='Only handle rooms in this shard (can be repeated)'
+        )
+
+    def handle(self, shards=None, **options):
+        loop = asyncio.get_event_loop()
+        worker = AsyncRoomWorker(room_channels(shards), loop=loop)
+        try:
+            loop.run_until_complete(worker.run())
+        except KeyboardInterrupt:
+            pass
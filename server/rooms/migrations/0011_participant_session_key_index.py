@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0010_message_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='participant',
+            name='session_key',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0011_participant_session_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='config_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,9 +2,26 @@ from django.db import models
 from django.contrib.postgres.fields import JSONField
 from django.utils import timezone
 
+from django.conf import settings
 from model_utils import Choices
 import json
 
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def dumps(obj):
+    """
+    JSON-encode `obj` for the wire, with ujson if FIRESIDE_FAST_JSON is
+    set and it is installed.
+    """
+    if ujson is not None and settings.FIRESIDE_FAST_JSON:
+        return ujson.dumps(obj, escape_forward_slashes=False)
+    return json.dumps(obj)
+
+
 class Message(models.Model):
     TYPE = Choices(
         ('s', 'signalling', 'signalling'),
@@ -30,8 +47,14 @@ class Message(models.Model):
     timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
         get_latest_by = 'timestamp'
+        indexes = [
+            models.Index(
+                fields=['room', 'timestamp', 'id'],
+                name='rooms_message_room_ts_id_idx'
+            ),
+        ]
 
     @classmethod
     def encode_message_dict(cls, message_dict):
@@ -42,18 +65,38 @@ class Message(models.Model):
         }
         if not out.get('t') or not out.get('p'):
             raise ValueError("Invalid message")
-        return json.dumps(out)
+        return dumps(out)
 
     def encode(self):
-        from ..serializers import MessageSerializer
-        data = MessageSerializer(self).data
-        if 'uid' in data:
-            # rename.
-            # TODO: do in a nicer way?
-            data['participant_id'] = data['uid']
-            del data['uid']
-        return self.encode_message_dict(data)
+        """
+        Encode the message in the wire format. This gives the same output
+        as encoding `MessageSerializer(self).data`, but builds it directly,
+        as it is on the hot path for signalling messages.
+        """
+        if not self.type or not self.payload:
+            raise ValueError("Invalid message")
+        return dumps({
+            't': str(self.type),
+            'T': (
+                int(self.timestamp.timestamp() * 1000)
+                if self.timestamp is not None else None
+            ),
+            'p': self.payload,
+            'P': str(self.peer_id) if self.peer_id is not None else None,
+            'u': (
+                int(self.participant_id)
+                if self.participant_id is not None else None
+            ),
+            'i': int(self.id) if self.id is not None else None,
+        })
 
+    @classmethod
+    def get_metric_labels(cls, type, payload):
+        """Labels for metrics about a message of `type` with `payload`."""
+        event_type = ''
+        if type == cls.TYPE.event and isinstance(payload, dict):
+            event_type = str(payload.get('type', ''))
+        return {'type': cls.TYPE[type], 'event_type': event_type}
 
     @classmethod
     def decode(cls, message_dict):
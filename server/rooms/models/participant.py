@@ -7,33 +7,58 @@ from accounts.models import User
 
 class ParticipantManager(models.Manager):
     def from_request(self, request, create=False):
-        return self.from_user_or_session(
-            request.user,
-            request.session,
-            create=create
-        )
+        # remembered for the rest of the request, as both the permission
+        # checks and the view need it. DRF wraps the HttpRequest, so keep
+        # it on that
+        http_request = getattr(request, '_request', request)
+        participant = getattr(http_request, '_participant', None)
+        if participant is None:
+            participant = self.from_user_or_session(
+                request.user,
+                request.session,
+                create=create
+            )
+            http_request._participant = participant
+        return participant
 
     def from_user_or_session(self, user, session, create=False):
+        """
+        Get the participant for `user`, or for `session` if they aren't
+        logged in, creating it if `create` is set. Which participant that
+        is gets cached, so usually this doesn't need a query.
+        """
+        from .. import cache
         if user.is_authenticated():
-            return self.get(user=user)
+            key = f'user.{user.pk}'
+            lookup = {'user': user}
+            create = False
         else:
             if session.session_key is None:
+                if not create:
+                    # a new session can't have a participant yet
+                    raise self.model.DoesNotExist
                 session.save()
-            if create:
-                participant, _ = self.get_or_create(
-                    session_key=session.session_key
-                )
-            else:
-                participant = self.get(
-                    session_key=session.session_key
-                )
-            return participant
+            key = f'session.{session.session_key}'
+            lookup = {'session_key': session.session_key}
+
+        try:
+            return cache.participants.get(cache.participant_ids.peek(key))
+        except (KeyError, self.model.DoesNotExist):
+            pass
+        if create:
+            participant, _ = self.get_or_create(**lookup)
+        else:
+            participant = self.get(**lookup)
+        cache.participant_ids.set(key, participant.pk)
+        cache.participants.add(participant)
+        return participant
 
 
 class Participant(models.Model):
     user = models.OneToOneField('accounts.User', blank=True, null=True,
                                 related_name='participant')
-    session_key = models.CharField(max_length=32, blank=True, null=True)
+    session_key = models.CharField(max_length=32, blank=True, null=True,
+                                   db_index=True)
     name = models.CharField(max_length=64, blank=True, null=True)
 
     def get_display_name(self):
@@ -2,7 +2,8 @@ import uuid
 import json
 import random
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Prefetch
 from django.core.urlresolvers import reverse
 from django.utils.timezone import now
 from django.contrib.postgres.fields import JSONField
@@ -11,12 +12,18 @@ from django.conf import settings
 from channels import Group, Channel
 from model_utils import Choices
 
-from fireside import redis_conn
+from fireside import redis_conn, metrics
 import recordings.serializers
 
 from .message import Message
 from .. import serializers
 from ..peers import PeerManager
+from ..livestate import (
+    LIVE_FIELDS, apply_recording_states, encode_recording_state,
+    get_recording_state_flusher,
+)
+from ..writebehind import get_message_writer
+from ..coalescing import get_event_coalescer
 
 
 class RoomManager(models.Manager):
@@ -65,6 +72,8 @@ class Room(models.Model):
     #: Field for storing the room config.
     #: See RoomConfigSerializer for docs.
     config = JSONField(blank=True, null=True, default=dict)
+    #: Goes up by one whenever the config changes; see rooms.roomconfig.
+    config_version = models.PositiveIntegerField(default=0)
 
     objects = RoomManager()
 
@@ -131,7 +140,11 @@ class Room(models.Model):
                 room=self,
             )
 
-        self.send(message)
+        coalesce = settings.FIRESIDE_EVENT_COALESCE_INTERVAL
+        if coalesce and self.should_coalesce_message(message):
+            get_event_coalescer().add(self, message)
+        else:
+            self.send(message)
 
     def get_initial_data(self):
         return serializers.InitialRoomDataSerializer(self).data
@@ -150,26 +163,51 @@ class Room(models.Model):
             to = self.peers[to_peer_id].channel
         if save is None and to_peer_id is None:
             save = self.should_save_message(message)
+        trace = getattr(message, 'trace', None)
         if save:
             self.add_message(message)
+            if trace is not None:
+                trace.stamp('saved')
         to.send({'text': message.encode()})
-
-    def set_config(self, new_config):
-        """Update the room config, and send an update_config event"""
-        self.config = new_config
-        self.save()
+        if trace is not None:
+            trace.stamp('fanout')
+
+        labels = Message.get_metric_labels(message.type, message.payload)
+        metrics.messages_sent.inc(**labels)
+        # counting the peers is another round trip, so only sample it
+        if to_peer_id is None and settings.FIRESIDE_METRICS_ENABLED:
+            if random.random() < settings.FIRESIDE_METRICS_FANOUT_SAMPLE_RATE:
+                metrics.message_fanout.observe(
+                    self.peers.count(), type=labels['type']
+                )
+
+    def set_config(self, changes, version=None):
+        """
+        Update the room config with `changes`, and send an update_config
+        event. If `version` is given, the update only applies if that's
+        the current version; see `roomconfig.update`.
+        """
+        from .. import roomconfig
+        from ..bootstrap import invalidate_room_document
+        from ..cache import caches
+        room_config = roomconfig.update(self.id, changes, version=version)
+        self.config = room_config.config
+        self.config_version = room_config.version
+        # the row was updated without saving it, so there's no signal
+        caches[self._meta.label_lower].invalidate(self.id)
+        invalidate_room_document(self.id)
         self.send(self.message(
             type=Message.TYPE.event,
             payload={
                 'type': 'update_config',
-                'data': new_config
+                'data': {**changes, 'version': room_config.version},
             }
         ))
 
     def get_config(self):
-        """Get the room config."""
-        self.refresh_from_db(fields=['config'])
-        return serializers.RoomConfigSerializer(self.config).data
+        """Get the room config, including its version."""
+        from .. import roomconfig
+        return roomconfig.get(self.id).to_json()
 
     def _send_action_event(self, name, target_peer_id, from_peer_id,
                           from_participant, data=None):
@@ -207,7 +245,10 @@ class Room(models.Model):
         raise NotImplementedError
 
     def change_member_name(self, participant, name):
+        from ..bootstrap import invalidate_room_document
         self.memberships.filter(participant=participant).update(name=name)
+        if participant.id == self.owner_id:
+            invalidate_room_document(self.id)
         self.send(self.message(
             type=Message.TYPE.event,
             payload={
@@ -220,8 +261,13 @@ class Room(models.Model):
         ))
 
     def announce(self, peer_id, participant):
-        mem = self.memberships.get(participant=participant)
-        mem._peer_id = peer_id
+        mem = self.memberships.with_peer_info(self).get(
+            participant=participant
+        )
+        mem.hydrate_peer({
+            'id': peer_id,
+            'data': self.peers.get_all_peer_data(peer_id),
+        })
         self.send(self.message(
             type=Message.TYPE.announce,
             payload={
@@ -251,11 +297,8 @@ class Room(models.Model):
         if not self.members.filter(id=participant.id).exists():
             raise RoomMembership.DoesNotExist
 
-        peer = self.peers.for_participant(participant)
-        if peer is None:
-            return self.peers.connect(participant, channel_name).id
-        else:
-            return peer.id
+        # PeerManager.connect returns the existing peer if there is one
+        return self.peers.connect(participant, channel_name).id
 
     def create_recording(self, **kwargs):
         """
@@ -275,40 +318,88 @@ class Room(models.Model):
         return rec
 
     def update_recordings(self, recordings, participant):
+        """
+        Sync `participant`'s recordings with `recordings`, as sent by their
+        client. Only the recordings that changed are saved, in bulk, and
+        sent to the room in a single update_recordings event. Changes to
+        the live fields of existing recordings go to their live state, like
+        update_recording events do, to be flushed with the rest of it.
+        """
         from recordings.models import Recording
         from recordings.serializers import RecordingSerializer
         existing = {
             r.id: r
             for r in self.recordings.filter(participant=participant)
         }
+        # compare against the live state, which is newer than the database
+        apply_recording_states(
+            existing.values(), self.peers.get_recording_states()
+        )
+        created, updated, changed_fields = [], [], set()
+        changed, live_states = [], {}
         for recording_data in recordings:
             rec = existing.get(recording_data['id'])
             if rec is not None:
-                for field, val in recording_data.items():
-                    if field not in ('room_id', 'participant_id'):
-                        setattr(rec, field, val)
-                rec.save()
+                changes = {
+                    field: val
+                    for field, val in recording_data.items()
+                    if field not in ('id', 'room_id', 'participant_id')
+                    if getattr(rec, field) != val
+                }
+                if not changes:
+                    continue
+                for field, val in changes.items():
+                    setattr(rec, field, val)
+                changed.append(rec)
+                live = {
+                    k: v for k, v in changes.items() if k in LIVE_FIELDS
+                }
+                if live:
+                    live_states[rec.id] = encode_recording_state(live)
+                if len(live) < len(changes):
+                    changed_fields.update(set(changes) - set(live))
+                    updated.append(rec)
             else:
                 rec = Recording(**recording_data)
                 rec.room = self
                 rec.participant = participant
-                rec.save()
+                created.append(rec)
+
+        if not created and not changed:
+            return
+        with transaction.atomic():
+            Recording.objects.bulk_create(created)
+            Recording.objects.filter(room=self).bulk_update(
+                updated, changed_fields
+            )
+        if live_states:
+            self.peers.set_recording_states(live_states, participant.id)
+            get_recording_state_flusher().start()
 
-            self.send(self.message(
-                type=Message.TYPE.event,
-                payload={
-                    'type': 'update_recording',
-                    'data': RecordingSerializer(rec).data,
-                },
-                participant_id=rec.participant_id,
-                peer_id=self.peers.for_participant(rec.participant).id
-            ))
+        peer = self.peers.for_participant(participant)
+        self.send(self.message(
+            type=Message.TYPE.event,
+            payload={
+                'type': 'update_recordings',
+                'data': RecordingSerializer(created + changed, many=True).data,
+            },
+            participant_id=participant.id,
+            peer_id=peer.id if peer is not None else None
+        ))
 
     def add_message(self, message):
+        """
+        Save `message` to the room. In write-behind mode
+        (FIRESIDE_MESSAGE_WRITE_BEHIND), the message is only given an id
+        and queued, to be saved in a batch later.
+        """
         if message.id is not None:
             raise ValueError("This message was already added.")
         message.room = self
-        message.save()
+        if settings.FIRESIDE_MESSAGE_WRITE_BEHIND:
+            get_message_writer().enqueue(message)
+        else:
+            message.save()
 
     def should_save_message(self, message):
         if message.type in (Message.TYPE.leave, Message.TYPE.announce):
@@ -323,6 +414,7 @@ class Room(models.Model):
             event_type = message.payload['type']
             if event_type in (
                 'update_recording',
+                'update_recordings',
                 'update_meter',
                 'update_upload_progress',
             ):
@@ -335,6 +427,21 @@ class Room(models.Model):
                         return False
             return True
 
+    def should_coalesce_message(self, message):
+        """
+        Whether `message` is a high-frequency, unsaved status event, where
+        only the latest value from each peer matters.
+        """
+        if message.type != Message.TYPE.event:
+            return False
+        event_type = message.payload['type']
+        if event_type in ('update_meter', 'update_upload_progress'):
+            return True
+        if event_type == 'update_status':
+            data = message.payload.get('data') or {}
+            return bool(data) and set(data) <= {'disk_usage', 'resources'}
+        return False
+
     def get_socket_url(self):
         return self.get_absolute_url() + "socket"
 
@@ -353,6 +460,27 @@ class Room(models.Model):
     def get_recordings_url(self):
         return reverse('rooms:recordings', kwargs={'room_id': self.id})
 
+    def get_config_url(self):
+        return reverse('rooms:config', kwargs={'room_id': self.id})
+
+
+class RoomMembershipQuerySet(models.QuerySet):
+    def with_peer_info(self, room):
+        """
+        Load everything needed to serialize the memberships of `room` with
+        `MembershipSerializer` up front: participants, users and the
+        participants' recordings in this room. This keeps the number of
+        queries fixed regardless of the number of members.
+        """
+        from recordings.models import Recording
+        return self.select_related('participant__user').prefetch_related(
+            Prefetch(
+                'participant__recordings',
+                queryset=Recording.objects.filter(room=room),
+                to_attr='room_recordings',
+            )
+        )
+
 
 class RoomMembership(models.Model):
     ROLE = Choices(
@@ -370,6 +498,8 @@ class RoomMembership(models.Model):
     joined = models.DateTimeField(auto_now_add=True)
     onboarding_complete = models.BooleanField(default=False)
 
+    objects = RoomMembershipQuerySet.as_manager()
+
     class Meta:
         unique_together = ('room', 'participant')
 
@@ -382,47 +512,66 @@ class RoomMembership(models.Model):
 
     @property
     def peer_id(self):
-        if hasattr(self, '_peer_id'):
-            return self._peer_id
-        else:
+        if not hasattr(self, '_peer_id'):
             peer = self.room.peers.for_participant(self.participant)
-            return peer.id if peer else None
+            self._peer_id = peer.id if peer else None
+        return self._peer_id
+
+    def hydrate_peer(self, peer):
+        """
+        Set the peer id and peer data from an entry of
+        `PeerManager.snapshot()` (or None if not connected), so they
+        don't need to be looked up individually.
+        """
+        if peer is None:
+            self._peer_id = None
+            self._peer_data = {}
+        else:
+            self._peer_id = peer['id']
+            self._peer_data = peer['data']
+
+    def get_peer_data(self, key):
+        if hasattr(self, '_peer_data'):
+            return self._peer_data.get(key)
+        elif self.peer_id:
+            return self.room.peers.get_peer_data(self.peer_id, key)
+        else:
+            return None
 
     @property
     def current_recording_id(self):
-        return (
-            self.recordings.latest().values_list('id', flat=True) or
-            [None]
-        )[0]
+        rec = self.current_recording
+        return rec.id if rec is not None else None
 
     @property
     def current_recording(self):
-        return self.recordings.latest()
+        """The most recently started recording that hasn't ended, if any."""
+        in_progress = [
+            rec for rec in self.recordings
+            if rec.ended is None and rec.started is not None
+        ]
+        if not in_progress:
+            return None
+        return max(in_progress, key=lambda rec: rec.started)
 
     @property
     def disk_usage(self):
-        if self.peer_id:
-            return self.room.peers[self.peer_id]['disk_usage']
-        else:
-            return None
+        return self.get_peer_data('disk_usage')
 
     @property
     def resources(self):
-        if self.peer_id:
-            return self.room.peers[self.peer_id]['resources']
-        else:
-            return None
+        return self.get_peer_data('resources')
 
     @property
     def recorder_status(self):
-        if self.peer_id:
-            return self.room.peers[self.peer_id]['recorder_status']
-        else:
-            return None
+        return self.get_peer_data('recorder_status')
 
     @property
     def recordings(self):
-        return self.participant.recordings.all().filter(room=self.room)
+        if hasattr(self.participant, 'room_recordings'):
+            # prefetched by RoomMembershipQuerySet.with_peer_info
+            return self.participant.room_recordings
+        return self.participant.recordings.all().filter(room_id=self.room_id)
 
     def get_display_name(self):
         if self.name is not None:
@@ -1,13 +1,89 @@
 import uuid
 import json
+from django.conf import settings
 from .models import Participant
+from .livestate import (
+    DIRTY_RECORDINGS_KEY, apply_recording_states, decode_recording_state
+)
 from channels import Channel
+from fireside.metrics import redis_latency, timed
+
+
+#: Atomically connects a peer, unless the participant already has one.
+#: KEYS: participant peer_id key, room peers hash, peer data hash
+#: ARGV: new peer id, participant id, JSON-encoded channel name
+#: Returns the id of the participant's peer (new or existing).
+CONNECT_SCRIPT = """
+local existing = redis.call('GET', KEYS[1])
+if existing then
+    return existing
+end
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[3], 'channel', ARGV[3])
+return ARGV[1]
+"""
+
+#: Atomically removes a peer and all of its data.
+#: KEYS: room peers hash, peer data hash
+#: ARGV: peer id, participant key prefix
+#: Returns the participant id the peer belonged to, or nil.
+DISCONNECT_SCRIPT = """
+local participant_id = redis.call('HGET', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[2])
+if participant_id then
+    local key = ARGV[2] .. participant_id .. ':peer_id'
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+return participant_id
+"""
+
+#: Fetches peers of a room along with all of their data, skipping any that
+#: have disconnected. The peer ids are read beforehand, so that every key
+#: the script touches can be passed in KEYS.
+#: KEYS: room peers hash, then the data hash of each peer
+#: ARGV: peer ids, in the same order as their data hashes
+#: Returns a flat list of [peer_id, participant_id, [k1, v1, ...], ...]
+SNAPSHOT_SCRIPT = """
+local result = {}
+for i, peer_id in ipairs(ARGV) do
+    local participant_id = redis.call('HGET', KEYS[1], peer_id)
+    if participant_id then
+        result[#result + 1] = peer_id
+        result[#result + 1] = participant_id
+        result[#result + 1] = redis.call('HGETALL', KEYS[i + 1])
+    end
+end
+return result
+"""
+
+
+#: Fetches the live state of recordings of a room, skipping any that are no
+#: longer active. Like SNAPSHOT_SCRIPT, the ids are read beforehand.
+#: KEYS: room recordings set, then the live state hash of each recording
+#: ARGV: recording ids, in the same order as their live state hashes
+#: Returns a flat list of [recording_id, [k1, v1, ...], ...]
+RECORDING_STATES_SCRIPT = """
+local result = {}
+for i, id in ipairs(ARGV) do
+    if redis.call('SISMEMBER', KEYS[1], id) == 1 then
+        result[#result + 1] = id
+        result[#result + 1] = redis.call('HGETALL', KEYS[i + 1])
+    end
+end
+return result
+"""
+
 
 class Peer():
-    def __init__(self, manager, id):
+    def __init__(self, manager, id, channel_name=None):
         self.id = id
         self.manager = manager
         self._participant = None
+        self._channel_name = channel_name
 
     def disconnect(self):
         return self.manager.disconnect_peer(self.id)
@@ -28,10 +104,16 @@ class Peer():
 
     @property
     def channel(self):
-        return Channel(self['channel'])
+        if self._channel_name is None:
+            self._channel_name = self['channel']
+        return Channel(self._channel_name)
 
 
 class PeerManager:
+    #: Registered scripts by source, shared by every manager so that each
+    #: script is only hashed once per process.
+    _scripts = {}
+
     def __init__(self, redis_conn, room):
         self.redis_conn = redis_conn
         self.room = room
@@ -40,6 +122,7 @@ class PeerManager:
     def _prefix(self):
         return f'rooms:{self.room.id}'
 
+    @timed(redis_latency, operation='for_participant')
     def for_participant(self, participant):
         peer_id = self.redis_conn.get(
             f'{self._prefix}:participants:{participant.id}:peer_id',
@@ -48,9 +131,15 @@ class PeerManager:
             return Peer(self, peer_id)
         return None
 
+    @timed(redis_latency, operation='get_participant_id')
     def get_participant_id(self, peer_id):
         return int(self.redis_conn.hget(f'{self._prefix}:peers', peer_id))
 
+    @timed(redis_latency, operation='count')
+    def count(self):
+        """The number of connected peers."""
+        return self.redis_conn.hlen(f'{self._prefix}:peers')
+
     @property
     def ids(self):
         return self.redis_conn.hkeys(f'{self._prefix}:peers')
@@ -59,35 +148,58 @@ class PeerManager:
     def participant_ids(self):
         return [int(x) for x in self.redis_conn.hvals(f'{self._prefix}:peers')]
 
+    def _run_script(self, script, keys, args):
+        registered = self._scripts.get(script)
+        if registered is None:
+            registered = self.redis_conn.register_script(script)
+            self._scripts[script] = registered
+        return registered(keys=keys, args=args, client=self.redis_conn)
+
+    @timed(redis_latency, operation='connect')
     def connect(self, participant, channel_name):
-        peer_id = uuid.uuid4().hex
-        self.redis_conn.set(
-            f'{self._prefix}:participants:{participant.id}:peer_id',
-            peer_id
-        )
-        self.redis_conn.hset(
-            f'{self._prefix}:peers',
-            peer_id,
-            participant.id
+        """
+        Connect `participant` on `channel_name` in a single atomic round
+        trip. If the participant is already connected, their existing
+        peer is returned untouched.
+        """
+        new_peer_id = uuid.uuid4().hex
+        peer_id = self._run_script(
+            CONNECT_SCRIPT,
+            keys=[
+                f'{self._prefix}:participants:{participant.id}:peer_id',
+                f'{self._prefix}:peers',
+                f'{self._prefix}:peers:{new_peer_id}',
+            ],
+            args=[new_peer_id, participant.id, json.dumps(channel_name)],
         )
-        self.set_peer_data(peer_id, 'channel', channel_name)
+        if peer_id == new_peer_id:
+            return Peer(self, peer_id, channel_name=channel_name)
         return Peer(self, peer_id)
 
+    @timed(redis_latency, operation='disconnect_peer')
     def disconnect_peer(self, peer_id):
-        participant_id = self.redis_conn.hget(
-            f'{self._prefix}:peers',
-            peer_id,
+        """
+        Remove `peer_id` and its data in a single atomic round trip.
+        Returns the id of the participant it belonged to, or None.
+        """
+        participant_id = self._run_script(
+            DISCONNECT_SCRIPT,
+            keys=[
+                f'{self._prefix}:peers',
+                f'{self._prefix}:peers:{peer_id}',
+            ],
+            args=[peer_id, f'{self._prefix}:participants:'],
         )
-        self.redis_conn.hdel(f'{self._prefix}:peers', peer_id)
-        self.redis_conn.delete(f'{self._prefix}:peers:{peer_id}')
-        self.redis_conn.delete(f'{self._prefix}:participants:{participant_id}:peer_id')
+        return int(participant_id) if participant_id is not None else None
 
+    @timed(redis_latency, operation='set_peer_data')
     def set_peer_data(self, peer_id, key, data):
         self.redis_conn.hset(f'{self._prefix}:peers:{peer_id}',
             key,
             json.dumps(data)
         )
 
+    @timed(redis_latency, operation='get_peer_data')
     def get_peer_data(self, peer_id, key):
         res = self.redis_conn.hget(
             f'{self._prefix}:peers:{peer_id}',
@@ -98,30 +210,165 @@ class PeerManager:
         else:
             return res
 
+    def set_recording_state(self, recording_id, participant_id, state):
+        """
+        Store `state` (raw recording fields, as sent by the client) as the
+        live state of recording `recording_id`, to be written to the
+        database later by the RecordingStateFlusher.
+        """
+        self.set_recording_states({recording_id: state}, participant_id)
+
+    @timed(redis_latency, operation='set_recording_states')
+    def set_recording_states(self, states, participant_id):
+        """
+        Like `set_recording_state`, for several of `participant_id`'s
+        recordings at once: `states` maps recording ids to their state.
+        """
+        pipe = self.redis_conn.pipeline()
+        for recording_id, state in states.items():
+            key = f'{self._prefix}:recordings:{recording_id}'
+            pipe.hmset(key, {
+                'participant_id': participant_id,
+                **{k: json.dumps(v) for k, v in state.items()}
+            })
+            pipe.expire(key, settings.FIRESIDE_RECORDING_STATE_TTL)
+            pipe.sadd(f'{self._prefix}:recordings', recording_id)
+            pipe.zincrby(
+                DIRTY_RECORDINGS_KEY, f'{self.room.id}:{recording_id}'
+            )
+        pipe.execute()
+
+    @timed(redis_latency, operation='pop_recording_state')
+    def pop_recording_state(self, recording_id):
+        """
+        Remove the live state of recording `recording_id`, returning it as
+        (participant_id, state), or (None, {}) if there was none.
+        """
+        key = f'{self._prefix}:recordings:{recording_id}'
+        pipe = self.redis_conn.pipeline()
+        pipe.hgetall(key)
+        pipe.delete(key)
+        pipe.srem(f'{self._prefix}:recordings', recording_id)
+        pipe.zrem(DIRTY_RECORDINGS_KEY, f'{self.room.id}:{recording_id}')
+        return decode_recording_state(pipe.execute()[0])
+
+    @timed(redis_latency, operation='get_recording_states')
+    def get_recording_states(self):
+        """
+        The live state of every active recording in the room, in at most
+        two round trips, as a dict mapping recording ids to
+        (participant_id, state).
+        """
+        ids = list(self.redis_conn.smembers(f'{self._prefix}:recordings'))
+        if not ids:
+            return {}
+        res = self._run_script(
+            RECORDING_STATES_SCRIPT,
+            keys=[
+                f'{self._prefix}:recordings',
+                *(f'{self._prefix}:recordings:{id}' for id in ids),
+            ],
+            args=ids,
+        )
+        return {
+            res[i]: decode_recording_state(
+                dict(zip(res[i + 1][::2], res[i + 1][1::2]))
+            )
+            for i in range(0, len(res), 2)
+            if res[i + 1]
+        }
+
+    @timed(redis_latency, operation='get_all_peer_data')
+    def get_all_peer_data(self, peer_id):
+        """Fetch all of the data stored for `peer_id` in one round trip."""
+        return {
+            k: json.loads(v)
+            for k, v in self.redis_conn.hgetall(
+                f'{self._prefix}:peers:{peer_id}'
+            ).items()
+        }
+
+    @timed(redis_latency, operation='snapshot')
+    def snapshot(self):
+        """
+        Fetch every connected peer in the room along with its data, in at
+        most two round trips. Returns a dict mapping participant ids to
+        `{'id': peer_id, 'data': {...}}`.
+        """
+        peer_ids = self.ids
+        if not peer_ids:
+            return {}
+        res = self._run_script(
+            SNAPSHOT_SCRIPT,
+            keys=[
+                f'{self._prefix}:peers',
+                *(f'{self._prefix}:peers:{id}' for id in peer_ids),
+            ],
+            args=peer_ids,
+        )
+        snapshot = {}
+        for i in range(0, len(res), 3):
+            peer_id, participant_id, data = res[i:i + 3]
+            snapshot[int(participant_id)] = {
+                'id': peer_id,
+                'data': {
+                    data[j]: json.loads(data[j + 1])
+                    for j in range(0, len(data), 2)
+                },
+            }
+        return snapshot
+
+    def hydrate_memberships(self, memberships, snapshot=None):
+        """
+        Attach peer ids and peer data from `snapshot` (by default, a fresh
+        one) to each of `memberships`, so that serializing them doesn't hit
+        Redis again. Returns the memberships as a list.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        memberships = list(memberships)
+        states = None
+        for mem in memberships:
+            mem.hydrate_peer(snapshot.get(mem.participant_id))
+            # only look at participants that were loaded along with the
+            # membership (see RoomMembershipQuerySet.with_peer_info), so
+            # that this never costs a query per member
+            cache_name = mem._meta.get_field('participant').get_cache_name()
+            participant = getattr(mem, cache_name, None)
+            if hasattr(participant, 'room_recordings'):
+                if states is None:
+                    states = self.get_recording_states()
+                apply_recording_states(participant.room_recordings, states)
+        return memberships
+
+    @timed(redis_latency, operation='getitem')
     def __getitem__(self, peer_id):
-        if self.redis_conn.hexists(f'{self._prefix}:peers', peer_id):
-            return Peer(self, peer_id)
+        # fetch the channel along with the existence check, so that
+        # sending to a peer only costs one round trip.
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.hexists(f'{self._prefix}:peers', peer_id)
+        pipe.hget(f'{self._prefix}:peers:{peer_id}', 'channel')
+        exists, channel = pipe.execute()
+        if exists:
+            return Peer(
+                self,
+                peer_id,
+                channel_name=json.loads(channel) if channel else None
+            )
         else:
             raise KeyError("Peer does not exist")
 
     def get_memberships_with_peer_ids(self):
-        participant_peers = {
-            int(v): k
-            for k, v in self.redis_conn.hgetall(f'{self._prefix}:peers').items()
-        }
-        memberships = []
-        for mem in self.room.memberships.filter(
-            participant__in=participant_peers.keys()
-        ):
-            mem._peer_id = participant_peers[mem.participant_id]
-            memberships.append(mem)
-        for mem in self.room.memberships.exclude(
-            participant__in=participant_peers.keys()
-        ):
-            mem._peer_id = None
-            memberships.append(mem)
+        """
+        All memberships of the room, hydrated with peer data, connected
+        members first.
+        """
+        memberships = self.hydrate_memberships(
+            self.room.memberships.with_peer_info(self.room).order_by('id')
+        )
+        memberships.sort(key=lambda mem: mem.peer_id is None)
         return memberships
 
     def __iter__(self):
         for peer_id in self.ids:
-            yield Peer(self, peer_id)
\ No newline at end of file
+            yield Peer(self, peer_id)
@@ -0,0 +1,141 @@
+"""
+Room config, versioned and cached in Redis.
+
+The `config` field of the room stays the source of truth, along with a
+version number that goes up by one with every change. Reads are served
+from a Redis hash, which holds the stored config, the serialized config
+and its version. Updates are written to the database first, on condition
+that the config hasn't changed since it was read, and then through to
+Redis, so concurrent updates can't clobber each other.
+"""
+import json
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from fireside import redis_conn
+from .models import Room
+from .serializers import RoomConfigSerializer
+
+#: How many times to retry an update that raced with another one
+MAX_UPDATE_ATTEMPTS = 5
+
+# only replaces what's cached with a newer version, so a slow writer
+# can't overwrite a more recent update
+STORE_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '-1')
+if current < tonumber(ARGV[1]) then
+    redis.call('HMSET', KEYS[1], 'version', ARGV[1], 'config', ARGV[2],
+               'data', ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+"""
+_store_script = redis_conn.register_script(STORE_SCRIPT)
+
+
+class ConfigConflict(Exception):
+    """
+    The config was changed since the version an update was based on.
+    Carries the current `version` and (serialized) `data`.
+    """
+    def __init__(self, version, data):
+        super().__init__(f'Room config is at version {version}')
+        self.version = version
+        self.data = data
+
+
+class RoomConfig:
+    def __init__(self, version, config, data=None):
+        self.version = version
+        #: the config as stored in the room
+        self.config = config
+        #: the config as sent to clients
+        self.data = (
+            data if data is not None
+            else RoomConfigSerializer(config).data
+        )
+
+    def to_json(self):
+        """The config as sent to clients, including its version."""
+        return {**self.data, 'version': self.version}
+
+
+def _key(room_id):
+    return f'rooms:{room_id}:config'
+
+
+def store(room_id, room_config):
+    _store_script(
+        keys=[_key(room_id)],
+        args=[
+            room_config.version,
+            json.dumps(room_config.config),
+            json.dumps(room_config.data),
+            settings.FIRESIDE_ROOM_CONFIG_TTL,
+        ],
+    )
+
+
+def load(room_id):
+    """Load the config of `room_id` from the database, and cache it."""
+    config, version = Room.objects.filter(id=room_id) \
+        .values_list('config', 'config_version').get()
+    room_config = RoomConfig(version, config or {})
+    store(room_id, room_config)
+    return room_config
+
+
+def get(room_id):
+    """The current config of `room_id`, from the cache if possible."""
+    cached = redis_conn.hgetall(_key(room_id))
+    if cached:
+        return RoomConfig(
+            int(cached['version']),
+            json.loads(cached['config']),
+            json.loads(cached['data']),
+        )
+    return load(room_id)
+
+
+def invalidate(room_id):
+    """
+    Drop the cached config of `room_id` once the current transaction
+    commits (or straight away, outside of one), so that it can't be
+    reloaded from the old row.
+    """
+    transaction.on_commit(partial(redis_conn.delete, _key(room_id)))
+
+
+def update(room_id, changes, version=None):
+    """
+    Apply `changes` to the config of `room_id`, and return the new
+    config. If `version` is given, it's the version the changes were
+    based on, and ConfigConflict is raised if that isn't current.
+    Otherwise the changes are applied to whatever the config is now.
+    """
+    current = get(room_id)
+    if version is not None and version != current.version:
+        # the cache may be behind the database
+        current = load(room_id)
+    for attempt in range(MAX_UPDATE_ATTEMPTS):
+        if version is not None and version != current.version:
+            raise ConfigConflict(current.version, current.data)
+        new = RoomConfig(current.version + 1, {**current.config, **changes})
+        updated = Room.objects.filter(
+            id=room_id, config_version=current.version
+        ).update(config=new.config, config_version=new.version)
+        if updated:
+            # nothing else can see the new version until it's committed
+            transaction.on_commit(partial(store, room_id, new))
+            return new
+        current = load(room_id)
+    raise ConfigConflict(current.version, current.data)
+
+
+@receiver(post_save, sender=Room)
+def invalidate_saved_room(sender, instance, **kwargs):
+    # the config may have been saved directly
+    invalidate(instance.id)
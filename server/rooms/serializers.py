@@ -55,6 +55,18 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ('id', 'uid', 'type', 'payload', 'timestamp', 'peer_id')
 
 
+class MessageHistoryParamsSerializer(serializers.Serializer):
+    """
+    Query params for a page of message history. `until` is a timestamp in
+    ms, for the first page. To get the next page, `until_id` is the id of
+    the last message of the previous one; the page continues from exactly
+    that message (by timestamp, then id), and `until` is ignored.
+    """
+    until = serializers.IntegerField(required=False)
+    until_id = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
 class RoomConfigSerializer(serializers.Serializer):
     UPLOAD_MODE_CHOICES = (
         ['p2p'] +
@@ -71,6 +83,10 @@ class RoomConfigSerializer(serializers.Serializer):
     upload_mode_choices = serializers.ListField(
         default=UPLOAD_MODE_CHOICES,
         read_only=True)
+    #: the version an update is based on, if the client knows it
+    version = serializers.IntegerField(
+        min_value=0, required=False, write_only=True
+    )
 
 
 class InitialRoomDataSerializer(serializers.Serializer):
@@ -78,7 +94,7 @@ class InitialRoomDataSerializer(serializers.Serializer):
         source='peers.get_memberships_with_peer_ids',
         many=True
     )
-    config = RoomConfigSerializer()
+    config = serializers.ReadOnlyField(source='get_config')
 
 
 class JoinRoomSerializer(serializers.Serializer):
@@ -0,0 +1,73 @@
+"""
+Partitioning of room traffic across channels.
+
+With FIRESIDE_ROOM_SHARDS > 1, each of the room.join, room.leave and
+room.receive channels is split into that many channels (e.g.
+room.receive.0, room.receive.1, ...), and each room's messages always go
+to the same shard. Running one worker per shard, e.g.
+
+    ./manage.py runworker --only-channels='room.*.3'
+
+keeps each room's messages in order, while one slow room only holds up
+the rooms in its own shard. Shards are assigned with jump consistent
+hashing, so increasing the number of shards only moves the rooms that
+need to move to the new shards.
+"""
+import hashlib
+
+from django.conf import settings
+
+#: Kinds of room channel, mapped to the RoomConsumer method handling them
+ROOM_CHANNEL_KINDS = {
+    'join': 'join',
+    'leave': 'leave',
+    'receive': 'receive',
+}
+
+
+def jump_hash(key, num_buckets):
+    """
+    Jump consistent hash (Lamping & Veach): maps the 64-bit integer `key`
+    to a bucket in range(num_buckets).
+    """
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_for_room(room_id, num_shards=None):
+    if num_shards is None:
+        num_shards = settings.FIRESIDE_ROOM_SHARDS
+    key = int.from_bytes(
+        hashlib.md5(room_id.encode()).digest()[:8],
+        'big'
+    )
+    return jump_hash(key, num_shards)
+
+
+def shard_channel_name(kind, shard, num_shards=None):
+    if num_shards is None:
+        num_shards = settings.FIRESIDE_ROOM_SHARDS
+    if num_shards == 1:
+        # keep the plain channel names when not sharding
+        return f'room.{kind}'
+    return f'room.{kind}.{shard}'
+
+
+def room_channel_name(kind, room_id):
+    """The name of the `kind` channel for the room with id `room_id`."""
+    return shard_channel_name(kind, shard_for_room(room_id))
+
+
+def method_mapping(num_shards=None):
+    """Channel name to consumer method mapping, covering every shard."""
+    if num_shards is None:
+        num_shards = settings.FIRESIDE_ROOM_SHARDS
+    return {
+        shard_channel_name(kind, shard, num_shards): method
+        for kind, method in ROOM_CHANNEL_KINDS.items()
+        for shard in range(num_shards)
+    }
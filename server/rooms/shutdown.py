@@ -0,0 +1,22 @@
+import signal
+import threading
+
+
+def install_sigterm_handler():
+    """
+    Make SIGTERM exit the process normally, so that atexit callbacks (like
+    the ones flushing write-behind buffers) still run when it's stopped by
+    a supervisor or on deploy. Leaves any handler that's already installed
+    alone. Returns whether the handler was installed.
+    """
+    # signal handlers can only be set from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return False
+    signal.signal(signal.SIGTERM, _exit)
+    return True
+
+
+def _exit(signum, frame):
+    raise SystemExit(128 + signum)
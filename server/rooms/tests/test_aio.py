@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from rooms.aio import AsyncRoomWorker, create_redis_pool
+from rooms.models import Message
+
+pytestmark = [pytest.mark.django_db, pytest.mark.usefixtures('redisdb')]
+
+
+@pytest.fixture
+def worker(mocker):
+    loop = asyncio.new_event_loop()
+    worker = AsyncRoomWorker(['room.receive'], loop=loop,
+                             channel_layer=mocker.Mock())
+    worker.redis = loop.run_until_complete(create_redis_pool())
+    # run blocking calls inline, as the test database is per-connection
+    worker.run_blocking = asyncio.coroutine(
+        lambda fn, *args, **kwargs: fn(*args, **kwargs)
+    )
+    yield worker
+    worker.redis.close()
+    loop.run_until_complete(worker.redis.wait_closed())
+    loop.close()
+
+
+def handle(worker, channel, content):
+    worker.loop.run_until_complete(worker.handle(channel, content))
+
+
+class TestAsyncRoomWorker:
+    def test_relays_signalling(self, worker, room, user, user2, mocker):
+        peer = room.peers.connect(user.participant, 'user_channel')
+        peer2 = room.peers.connect(user2.participant, 'user2_channel')
+        channel = mocker.patch('rooms.aio.Channel')
+        dispatch = mocker.patch.object(worker, 'dispatch')
+        handle(worker, 'room.receive', {
+            'room_id': room.id,
+            'participant_id': user.participant.id,
+            'peer_id': peer.id,
+            'type': Message.TYPE.signalling,
+            'payload': {'to': peer2.id, 'sdp': 'x'},
+        })
+        channel.assert_called_once_with('user2_channel')
+        sent = channel.return_value.send.call_args[0][0]
+        msg = Message.decode_message_dict(json.loads(sent['text']))
+        assert msg['peer_id'] == peer.id
+        assert not dispatch.called
+
+    def test_unknown_peer_goes_to_consumer(self, worker, room, user, mocker):
+        peer = room.peers.connect(user.participant, 'user_channel')
+        dispatch = mocker.patch.object(worker, 'dispatch')
+        content = {
+            'room_id': room.id,
+            'participant_id': user.participant.id,
+            'peer_id': peer.id,
+            'type': Message.TYPE.signalling,
+            'payload': {'to': 'nobody'},
+        }
+        handle(worker, 'room.receive', content)
+        dispatch.assert_called_once_with('room.receive', content)
+
+    def test_join_goes_to_consumer(self, worker, room, user, mocker):
+        dispatch = mocker.patch.object(worker, 'dispatch')
+        content = {'room_id': room.id, 'participant_id': user.participant.id}
+        handle(worker, 'room.join', content)
+        dispatch.assert_called_once_with('room.join', content)
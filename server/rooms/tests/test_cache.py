@@ -0,0 +1,110 @@
+import pytest
+
+from rooms import cache
+from rooms.models import Room
+
+pytestmark = [pytest.mark.django_db, pytest.mark.usefixtures('redisdb')]
+
+
+@pytest.fixture
+def room_cache():
+    c = cache.ModelCache(Room, maxsize=2, ttl=60)
+    yield c
+    # don't leave the test cache registered for invalidations
+    cache.caches[c.name] = cache.rooms
+
+
+class TestModelCache:
+    def test_hits_and_misses(self, room_cache, room):
+        assert room_cache.get(room.id) == room
+        assert room_cache.get(room.id) is room_cache.get(room.id)
+        assert room_cache.stats() == {
+            'size': 1,
+            'maxsize': 2,
+            'hits': 2,
+            'misses': 1,
+        }
+
+    def test_bounded(self, room_cache, user):
+        rooms = [Room.objects.create_with_owner(user.participant)
+                 for i in range(3)]
+        for room in rooms:
+            room_cache.get(room.id)
+        assert len(room_cache) == 2
+        # least recently used room was evicted
+        room_cache.get(rooms[0].id)
+        assert room_cache.misses == 4
+
+    def test_ttl(self, room_cache, room, mocker):
+        monotonic = mocker.patch('rooms.cache.time.monotonic')
+        monotonic.return_value = 1000
+        room_cache.get(room.id)
+        monotonic.return_value = 1059
+        room_cache.get(room.id)
+        assert room_cache.hits == 1
+        monotonic.return_value = 1061
+        room_cache.get(room.id)
+        assert room_cache.misses == 2
+
+    @pytest.mark.usefixtures('channel_test')
+    def test_invalidated_on_save(self, room_cache, room, mocker):
+        publish = mocker.patch('rooms.cache.redis_conn.publish')
+        cached = room_cache.get(room.id)
+        room.set_config({'mode': 'video'})
+        publish.assert_called_with(
+            cache.INVALIDATION_CHANNEL,
+            f'rooms.room:{room.id}'
+        )
+        assert room_cache.get(room.id) is not cached
+        assert room_cache.get(room.id).config == {'mode': 'video'}
+
+    def test_handle_invalidation(self, room_cache, room):
+        room_cache.get(room.id)
+        cache.handle_invalidation({'data': f'rooms.room:{room.id}'})
+        assert len(room_cache) == 0
+
+
+@pytest.fixture
+def peer_channel_cache():
+    c = cache.PeerChannelCache(ttl=60)
+    yield c
+    cache.caches[c.name] = cache.peer_channels
+
+
+class TestPeerChannelCache:
+    def test_invalidated_across_processes(self, peer_channel_cache, room,
+                                          user):
+        peer = room.peers.connect(user.participant, 'old')
+        assert peer_channel_cache.get(room, peer.id) == 'old'
+        # as if the peer had rejoined on a new channel in another process
+        room.peers.set_peer_data(peer.id, 'channel', 'new')
+        cache.handle_invalidation({
+            'data': f'peer_channel:{room.id}:{peer.id}'
+        })
+        assert peer_channel_cache.get(room, peer.id) == 'new'
+
+    def test_invalidate(self, peer_channel_cache, room, user, mocker):
+        publish = mocker.patch('rooms.cache.redis_conn.publish')
+        peer = room.peers.connect(user.participant, 'xxx')
+        peer_channel_cache.get(room, peer.id)
+        peer_channel_cache.invalidate(room, peer.id)
+        assert len(peer_channel_cache) == 0
+        publish.assert_called_with(
+            cache.INVALIDATION_CHANNEL,
+            f'peer_channel:{room.id}:{peer.id}'
+        )
+
+
+def test_start_listener(settings, mocker):
+    settings.TEST = False
+    mocker.patch.object(cache, '_listener', None)
+    cache.start_listener()
+    listener = cache._listener
+    try:
+        assert listener.daemon
+        assert listener.is_alive()
+        # only started once
+        cache.start_listener()
+        assert cache._listener is listener
+    finally:
+        listener.stop()
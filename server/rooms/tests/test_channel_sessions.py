@@ -0,0 +1,52 @@
+import pytest
+from django.contrib.sessions.backends.base import CreateError
+
+from rooms import cache
+from rooms.channel_sessions import SessionStore
+
+pytestmark = pytest.mark.usefixtures('redisdb')
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.channel_sessions.clear()
+
+
+class TestChannelSessions:
+    def test_save_and_load(self):
+        session = SessionStore()
+        session['peer_id'] = 'abc'
+        session.save()
+        cache.channel_sessions.clear()
+        loaded = SessionStore(session_key=session.session_key)
+        assert loaded['peer_id'] == 'abc'
+        assert loaded.exists(session.session_key)
+
+    def test_missing(self):
+        session = SessionStore(session_key='chnmissing')
+        assert session.load() == {}
+        assert not session.exists('chnmissing')
+
+    def test_must_create(self):
+        session = SessionStore(session_key='chnkey')
+        session.save(must_create=True)
+        with pytest.raises(CreateError):
+            SessionStore(session_key='chnkey').save(must_create=True)
+
+    def test_loads_from_cache(self, mocker):
+        session = SessionStore()
+        session['peer_id'] = 'abc'
+        session.save()
+        redis_conn = mocker.patch('rooms.channel_sessions.redis_conn')
+        loaded = SessionStore(session_key=session.session_key)
+        assert loaded['peer_id'] == 'abc'
+        assert loaded.exists(session.session_key)
+        assert not redis_conn.method_calls
+
+    def test_delete(self):
+        session = SessionStore()
+        session['peer_id'] = 'abc'
+        session.save()
+        session.delete()
+        assert not session.exists(session.session_key)
+        assert SessionStore(session_key=session.session_key).load() == {}
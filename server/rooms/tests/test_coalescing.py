@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from rooms.coalescing import EventCoalescer
+from rooms.models import Message
+
+pytestmark = pytest.mark.django_db
+
+
+def meter(room, peer_id, level):
+    return room.message(type=Message.TYPE.event, peer_id=peer_id, payload={
+        'type': 'update_meter',
+        'data': {'level': level},
+    })
+
+
+def disk_usage(room, peer_id, usage):
+    return room.message(type=Message.TYPE.event, peer_id=peer_id, payload={
+        'type': 'update_status',
+        'data': {'disk_usage': {'usage': usage, 'quota': 100}},
+    })
+
+
+class TestEventCoalescer:
+    def test_keeps_latest_per_peer_and_type(self, room, mocker):
+        send = mocker.patch('rooms.models.Room.send')
+        coalescer = EventCoalescer(interval=1, pack=False, autostart=False)
+        for i in range(5):
+            coalescer.add(room, meter(room, 'peer1', i))
+            coalescer.add(room, meter(room, 'peer2', i * 2))
+            coalescer.add(room, disk_usage(room, 'peer1', i))
+        assert len(coalescer) == 3
+        assert coalescer.flush() == 3
+        sent = [call[0][0].payload['data'] for call in send.call_args_list]
+        assert {'level': 4} in sent
+        assert {'level': 8} in sent
+        assert {'disk_usage': {'usage': 4, 'quota': 100}} in sent
+        assert len(coalescer) == 0
+        assert coalescer.flush() == 0
+
+    def test_pack(self, room, mocker):
+        group = mocker.patch('rooms.coalescing.Group', autospec=True)
+        coalescer = EventCoalescer(interval=1, pack=True, autostart=False)
+        messages = [meter(room, 'peer1', 1), meter(room, 'peer2', 2)]
+        for msg in messages:
+            coalescer.add(room, msg)
+        assert coalescer.flush() == 1
+        group.assert_called_once_with(room.group_name)
+        text = group.return_value.send.call_args[0][0]['text']
+        assert json.loads(text) == [json.loads(m.encode()) for m in messages]
+
+
+class TestRoomCoalescing:
+    def test_should_coalesce_message(self, room):
+        assert room.should_coalesce_message(meter(room, 'peer1', 1))
+        assert room.should_coalesce_message(disk_usage(room, 'peer1', 1))
+        assert not room.should_coalesce_message(room.message(
+            type=Message.TYPE.event,
+            payload={'type': 'update_status', 'data': {'name': 'Dave'}}
+        ))
+        assert not room.should_coalesce_message(room.message(
+            type=Message.TYPE.event,
+            payload={'type': 'update_recording', 'data': {}}
+        ))
+        assert not room.should_coalesce_message(
+            room.message(type=Message.TYPE.announce, payload={'foo': 'bar'})
+        )
+
+    def test_receive_event(self, room, settings, mocker):
+        send = mocker.patch('rooms.models.Room.send')
+        coalescer = EventCoalescer(interval=1, autostart=False)
+        mocker.patch(
+            'rooms.models.room.get_event_coalescer',
+            return_value=coalescer
+        )
+        settings.FIRESIDE_EVENT_COALESCE_INTERVAL = 0
+        room.receive_event(meter(room, 'peer1', 1))
+        assert send.call_count == 1
+        settings.FIRESIDE_EVENT_COALESCE_INTERVAL = 0.5
+        room.receive_event(meter(room, 'peer1', 1))
+        assert send.call_count == 1
+        assert len(coalescer) == 1
@@ -1,5 +1,7 @@
 import pytest
 from channels.test import HttpClient
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from datetime import timedelta
 from rooms.models import RoomMembership, Message
@@ -55,7 +57,7 @@ def joined_clients(room, client, client2):
 @pytest.mark.usefixtures('redisdb', 'channel_test')
 @pytest.mark.django_db
 class TestRoomConsumer:
-    def send_message(self, client, room, **kwargs):
+    def send_message(self, client, room, consume_room=True, **kwargs):
         msg = room.message(**kwargs)
         client.send_and_consume('websocket.receive', {
             'text': msg.encode(),
@@ -63,7 +65,8 @@ class TestRoomConsumer:
         })
         # just consuming the websocket alone isn't enough
         # have to also consume on the room receive channel
-        client.consume('room.receive')
+        if consume_room:
+            client.consume('room.receive')
 
     def get_message(self, client, room):
         res = client.receive()
@@ -125,7 +128,8 @@ class TestRoomConsumer:
         assert msg.payload['config'] == {
             'mode': 'audio',
             'video_bitrate': None,
-            'debug_mode': False
+            'debug_mode': False,
+            'version': 0,
         }
 
         joined_peer1 = msg.payload['self']
@@ -203,12 +207,15 @@ class TestRoomConsumer:
 
     def test_signalling(self, room, joined_clients):
         client, client2 = joined_clients
+        # signalling is relayed straight to the peer, not via room.receive
         self.send_message(
             room=room,
             client=client,
+            consume_room=False,
             type=Message.TYPE.signalling,
             payload={'foo': 'bar', 'to': client2.peer_id}
         )
+        assert client.get_next_message('room.receive') is None
 
         msg = self.get_message(client2, room)
         assert msg.type == Message.TYPE.signalling
@@ -216,12 +223,57 @@ class TestRoomConsumer:
             'to': client2.peer_id,
             'foo': 'bar',
         }
+        assert msg.peer_id == client.peer_id
+        assert msg.participant == client.user.participant
 
         assert self.get_message(client, room) is None
 
         # the room shouldn't store the signalling message
         assert room.messages.count() == 2
 
+    def test_signalling_needs_no_queries(self, room, joined_clients):
+        client, client2 = joined_clients
+        with CaptureQueriesContext(connection) as queries:
+            self.send_message(
+                room=room,
+                client=client,
+                consume_room=False,
+                type=Message.TYPE.signalling,
+                payload={'foo': 'bar', 'to': client2.peer_id}
+            )
+        assert self.get_message(client2, room).payload['foo'] == 'bar'
+        assert len(queries) == 0
+
+    def test_signalling_unknown_peer(self, room, joined_clients):
+        client, client2 = joined_clients
+        to = uuid.uuid4().hex
+        self.send_message(
+            room=room,
+            client=client,
+            type=Message.TYPE.signalling,
+            payload={'foo': 'bar', 'to': to}
+        )
+        msg = self.get_message(client, room)
+        assert msg.type == Message.TYPE.event
+        assert msg.payload['type'] == 'signalling_error'
+        assert self.get_message(client2, room) is None
+
+    def test_trace(self, room, joined_clients, settings, mocker):
+        settings.FIRESIDE_TRACE_SAMPLE_RATE = 1.0
+        finish = mocker.patch('rooms.tracing.Trace.finish', autospec=True)
+        client, client2 = joined_clients
+        self.send_message(
+            room=room,
+            client=client,
+            type=Message.TYPE.event,
+            payload={'type': 'update_status', 'data': {'name': 'Hal'}}
+        )
+        trace, labels = finish.call_args[0]
+        assert [name for name, t in trace.stamps] == [
+            'ingress', 'dequeued', 'saved', 'fanout'
+        ]
+        assert labels == {'type': 'event', 'event_type': 'update_status'}
+
     def test_leave(self, room, joined_clients):
         client, client2 = joined_clients
         client2.send_and_consume(
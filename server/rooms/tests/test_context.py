@@ -0,0 +1,51 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+
+from rooms.context import RoomContext
+
+pytestmark = pytest.mark.django_db
+
+
+def test_load(room, user, user2, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        context = RoomContext.load(room.id, user2.participant)
+        assert context.is_member
+        assert not context.is_admin
+        assert context.membership.participant == user2.participant
+        assert context.owner_membership.participant == user.participant
+        context.owner_membership.get_display_name()
+
+
+def test_load_owner(room, user):
+    context = RoomContext.load(room.id, user.participant)
+    assert context.is_admin
+    assert context.membership is context.owner_membership
+
+
+def test_not_member(room, participant3):
+    context = RoomContext.load(room.id, participant3)
+    assert not context.is_member
+    assert not context.is_admin
+    assert context.membership is None
+
+
+def test_for_request(rf, room, user, mocker):
+    request = rf.get('/')
+    request.user = user
+    request.session = None
+    context = RoomContext.for_request(request, room.id)
+    assert context.participant == user.participant
+    load = mocker.patch.object(RoomContext, 'load')
+    assert RoomContext.for_request(request, room.id) is context
+    assert not load.called
+
+
+def test_for_request_no_room_or_participant(rf, room, mocker):
+    request = rf.get('/')
+    request.user = AnonymousUser()
+    request.session = mocker.MagicMock()
+    request.session.session_key = None
+    assert RoomContext.for_request(request, 'ZZZZZZ') is None
+    context = RoomContext.for_request(request, room.id)
+    assert context.participant is None
+    assert not context.is_member
@@ -0,0 +1,117 @@
+import pytest
+from django.db import DatabaseError
+
+from fireside import redis_conn
+from rooms import events
+from rooms.livestate import DIRTY_RECORDINGS_KEY, RecordingStateFlusher
+from rooms.models import Message
+
+pytestmark = [pytest.mark.django_db, pytest.mark.usefixtures('redisdb')]
+
+
+def send_event(room, participant, type, data):
+    message = room.message(
+        type=Message.TYPE.event,
+        payload={'type': type, 'data': data},
+        participant_id=participant.id,
+    )
+    getattr(events, type)(event=message.payload, message=message, room=room)
+
+
+class TestRecordingState:
+    def test_update_only_goes_to_redis(self, room, user, recording):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id),
+            'duration': 42,
+            'filesize': 1000,
+        })
+        recording.refresh_from_db()
+        assert recording.duration == 0
+        assert room.peers.get_recording_states() == {
+            str(recording.id): (
+                user.participant.id, {'duration': 42, 'filesize': 1000}
+            ),
+        }
+        assert redis_conn.zrange(DIRTY_RECORDINGS_KEY, 0, -1) == [
+            f'{room.id}:{recording.id}'
+        ]
+
+    def test_flush(self, room, user, recording, recording2):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'duration': 42,
+        })
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'filesize': 1000,
+        })
+        # not user's recording
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording2.id), 'duration': 99,
+        })
+        assert RecordingStateFlusher(batch_size=1).flush() == 1
+        recording.refresh_from_db()
+        assert recording.duration == 42
+        assert recording.filesize == 1000
+        recording2.refresh_from_db()
+        assert recording2.duration == 0
+        assert not redis_conn.zcard(DIRTY_RECORDINGS_KEY)
+        # the live state stays around until the recording stops
+        assert str(recording.id) in room.peers.get_recording_states()
+
+    def test_failed_flush_is_retried(self, room, user, recording, mocker):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'duration': 42,
+        })
+        flusher = RecordingStateFlusher()
+        mocker.patch.object(flusher, 'save', side_effect=DatabaseError)
+        with pytest.raises(DatabaseError):
+            flusher.flush()
+        assert redis_conn.zcard(DIRTY_RECORDINGS_KEY) == 1
+        mocker.stopall()
+        assert flusher.flush() == 1
+        recording.refresh_from_db()
+        assert recording.duration == 42
+        assert not redis_conn.zcard(DIRTY_RECORDINGS_KEY)
+
+    def test_update_during_flush_stays_dirty(self, room, user, recording,
+                                             mocker):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'duration': 42,
+        })
+        flusher = RecordingStateFlusher()
+        save = flusher.save
+
+        def save_and_update(states):
+            send_event(room, user.participant, 'update_recording', {
+                'id': str(recording.id), 'duration': 43,
+            })
+            return save(states)
+        mocker.patch.object(flusher, 'save', side_effect=save_and_update)
+        assert flusher.flush() == 1
+        recording.refresh_from_db()
+        assert recording.duration == 42
+        # the newer state is saved by the next flush
+        assert redis_conn.zcard(DIRTY_RECORDINGS_KEY) == 1
+
+    def test_stop_flushes(self, room, user, recording):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'duration': 42, 'is_paused': True,
+        })
+        send_event(room, user.participant, 'stop_recording', {
+            'id': str(recording.id), 'is_paused': False,
+        })
+        recording.refresh_from_db()
+        assert recording.duration == 42
+        assert not recording.is_paused
+        assert room.peers.get_recording_states() == {}
+        assert not redis_conn.zcard(DIRTY_RECORDINGS_KEY)
+
+    def test_hydrate_memberships(self, room, user, recording):
+        send_event(room, user.participant, 'update_recording', {
+            'id': str(recording.id), 'duration': 42,
+        })
+        memberships = room.peers.hydrate_memberships(
+            room.memberships.with_peer_info(room)
+        )
+        mem = next(m for m in memberships
+                   if m.participant_id == user.participant.id)
+        assert mem.recordings[0].duration == 42
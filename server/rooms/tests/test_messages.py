@@ -1,6 +1,11 @@
 import pytest
 import json
+import uuid
+from django.utils.timezone import now
 from rooms.models import Room, Message
+from rooms.management.commands.benchmark_encoding import (
+    encode_with_serializer
+)
 
 
 class TestMessageEncoding:
@@ -22,6 +27,29 @@ class TestMessageEncoding:
         with pytest.raises(ValueError, message='Invalid message'):
             Message(payload={2: 3}).encode()
 
+    def test_encode_matches_serializer(self):
+        ts = now()
+        messages = [
+            Message(room_id='ZZZZZ', type='e', payload={'foo': 'bar'}),
+            Message(
+                room_id='ZZZZZ',
+                type='s',
+                payload={'to': 'abc', 'candidate': 'x'},
+                timestamp=ts,
+                participant_id=4,
+                peer_id=uuid.uuid4().hex,
+                id=10,
+            ),
+            Message(
+                room_id='ZZZZZ',
+                type='a',
+                payload={'peer': {'uid': 1, 'info': None}},
+                peer_id=uuid.uuid4(),
+            ),
+        ]
+        for msg in messages:
+            assert msg.encode() == encode_with_serializer(msg)
+
     def test_decode(self):
         for type, type_name in Message.TYPE:
             msg = Message.decode({'t': type, 'p': {'foo': 'bar'}})
@@ -0,0 +1,91 @@
+import pytest
+
+from fireside import metrics
+from rooms.models import Message
+
+pytestmark = [pytest.mark.django_db, pytest.mark.usefixtures('redisdb')]
+
+
+@pytest.fixture
+def collector(mocker):
+    collector = metrics.Collector()
+    mocker.patch.object(metrics, 'collector', collector)
+    # drop metrics that tests define when they're done
+    mocker.patch.dict(metrics.registry)
+    return collector
+
+
+class TestMetrics:
+    def test_counter(self, collector):
+        counter = metrics.Counter('test_counter', 'A counter.', ['kind'])
+        counter.inc(kind='a')
+        counter.inc(2, kind='a')
+        counter.inc(kind='b')
+        lines = metrics.render().splitlines()
+        assert 'test_counter_total{kind="a"} 3' in lines
+        assert 'test_counter_total{kind="b"} 1' in lines
+        assert '# TYPE test_counter counter' in lines
+
+    def test_labels_checked(self, collector):
+        counter = metrics.Counter('test_counter', 'A counter.', ['kind'])
+        with pytest.raises(ValueError):
+            counter.inc(other='a')
+
+    def test_histogram(self, collector):
+        histogram = metrics.Histogram(
+            'test_histogram', 'A histogram.', buckets=(1, 5)
+        )
+        histogram.observe(0.5)
+        histogram.observe(3)
+        histogram.observe(10)
+        lines = [
+            line for line in metrics.render().splitlines()
+            if line.startswith('test_histogram')
+        ]
+        assert lines == [
+            'test_histogram_bucket{le="1"} 1',
+            'test_histogram_bucket{le="5"} 2',
+            'test_histogram_bucket{le="+Inf"} 3',
+            'test_histogram_count 3',
+            'test_histogram_sum 13.5',
+        ]
+
+    def test_summed_across_processes(self, collector):
+        counter = metrics.Counter('test_counter', 'A counter.')
+        counter.inc()
+        collector.flush()
+        # another process
+        other = metrics.Collector()
+        other.add('test_counter', '_total|', 2)
+        other.flush()
+        assert 'test_counter_total 3' in metrics.render().splitlines()
+
+    @pytest.mark.usefixtures('channel_test')
+    def test_room_send(self, collector, room, user, settings):
+        settings.FIRESIDE_METRICS_FANOUT_SAMPLE_RATE = 1.0
+        room.peers.connect(user.participant, 'xxx')
+        room.send(room.message(
+            type=Message.TYPE.event,
+            payload={'type': 'update_status', 'data': {}},
+        ))
+        lines = metrics.render().splitlines()
+        assert (
+            'fireside_messages_sent_total'
+            '{event_type="update_status",type="event"} 1'
+        ) in lines
+        assert 'fireside_message_fanout_sum{type="event"} 1' in lines
+
+    def test_endpoint(self, client, settings, collector):
+        settings.FIRESIDE_METRICS_ALLOWED_IPS = ['127.0.0.1']
+        response = client.get('/metrics/')
+        assert response.status_code == 200
+        assert b'# TYPE fireside_messages_sent counter' in response.content
+        response = client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        assert response.status_code == 403
+
+    def test_endpoint_allowed_networks(self, client, settings, collector):
+        settings.FIRESIDE_METRICS_ALLOWED_IPS = ['172.16.0.0/12']
+        response = client.get('/metrics/', REMOTE_ADDR='172.18.0.5')
+        assert response.status_code == 200
+        response = client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        assert response.status_code == 403
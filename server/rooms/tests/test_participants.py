@@ -1,6 +1,7 @@
 import pytest
 from django.contrib.auth.models import AnonymousUser
 from accounts.models import User
+from rooms import cache
 from rooms.models import Participant
 
 pytestmark = pytest.mark.django_db
@@ -22,3 +23,60 @@ def test_get_participant_from_request(rf, user, participant3, mocker):
     req2.session = mocker.MagicMock()
     req2.session.session_key = participant3.session_key
     assert Participant.objects.from_request(req2) == participant3
+
+
+@pytest.fixture
+def participant_ids():
+    cache.participant_ids.clear()
+    cache.participants.clear()
+    yield cache.participant_ids
+    cache.participant_ids.clear()
+
+
+@pytest.mark.usefixtures('redisdb')
+class TestParticipantResolution:
+    def session(self, mocker, session_key):
+        session = mocker.MagicMock()
+        session.session_key = session_key
+        return session
+
+    def test_cached(self, participant_ids, participant3, mocker,
+                    django_assert_num_queries):
+        session = self.session(mocker, participant3.session_key)
+        Participant.objects.from_user_or_session(AnonymousUser(), session)
+        with django_assert_num_queries(0):
+            assert Participant.objects.from_user_or_session(
+                AnonymousUser(), session
+            ) == participant3
+
+    def test_user_cached(self, participant_ids, user,
+                         django_assert_num_queries):
+        Participant.objects.from_user_or_session(user, None)
+        with django_assert_num_queries(0):
+            assert Participant.objects.from_user_or_session(
+                user, None
+            ) == user.participant
+
+    def test_deleted(self, participant_ids, participant3, mocker):
+        session = self.session(mocker, participant3.session_key)
+        Participant.objects.from_user_or_session(AnonymousUser(), session)
+        participant3.delete()
+        with pytest.raises(Participant.DoesNotExist):
+            Participant.objects.from_user_or_session(AnonymousUser(), session)
+
+    def test_new_session_not_saved(self, participant_ids, mocker):
+        session = self.session(mocker, None)
+        with pytest.raises(Participant.DoesNotExist):
+            Participant.objects.from_user_or_session(AnonymousUser(), session)
+        assert not session.save.called
+
+    def test_memoized_on_request(self, rf, participant_ids, user, mocker):
+        request = rf.get('/')
+        request.user = user
+        request.session = None
+        participant = Participant.objects.from_request(request)
+        from_user_or_session = mocker.patch.object(
+            Participant.objects, 'from_user_or_session'
+        )
+        assert Participant.objects.from_request(request) is participant
+        assert not from_user_or_session.called
@@ -19,17 +19,13 @@ class TestRoomPeers:
         assert room.peers.for_participant(participant3) is None
 
     @pytest.mark.usefixtures('redisdb')
-    def test_connect_peer(self, room, user, mocker):
-        m1 = mocker.patch('rooms.peers.PeerManager.set_peer_data')
+    def test_connect_peer(self, room, user):
         peer = room.peers.connect(
             participant=user.participant,
             channel_name='peer_channel_name',
         )
-        m1.assert_called_once_with(
-            peer.id,
-            'channel',
-            'peer_channel_name',
-        )
+        assert room.peers.get_peer_data(peer.id, 'channel') == \
+            'peer_channel_name'
         assert redis_conn.hget(
             f'rooms:{room.id}:peers',
             peer.id
@@ -38,6 +34,14 @@ class TestRoomPeers:
             f'rooms:{room.id}:participants:{user.participant.id}:peer_id'
         ) == peer.id
 
+    @pytest.mark.usefixtures('redisdb')
+    def test_connect_returns_existing_peer(self, room, user):
+        peer = room.peers.connect(user.participant, 'peer_channel_name')
+        peer2 = room.peers.connect(user.participant, 'other_channel_name')
+        assert peer2.id == peer.id
+        assert room.peers.ids == [peer.id]
+        assert peer2['channel'] == 'peer_channel_name'
+
     @pytest.mark.usefixtures('redisdb')
     def test_disconnect_peer(self, room, user):
         peer = room.peers.connect(
@@ -51,9 +55,25 @@ class TestRoomPeers:
         )
         assert not redis_conn.exists(f'rooms:{room.id}:peers:{peer.id}')
         assert not redis_conn.exists(
-            f'rooms:{room.id}:participants:{user.participant.id}'
+            f'rooms:{room.id}:participants:{user.participant.id}:peer_id'
         )
 
+    @pytest.mark.usefixtures('redisdb')
+    def test_disconnect_stale_peer(self, room, user):
+        peer = room.peers.connect(user.participant, 'peer_channel_name')
+        peer.disconnect()
+        peer2 = room.peers.connect(user.participant, 'peer_channel_name')
+        # disconnecting the old peer again mustn't clobber the new one
+        assert room.peers.disconnect_peer(peer.id) is None
+        assert room.peers.for_participant(user.participant).id == peer2.id
+
+    @pytest.mark.usefixtures('redisdb')
+    def test_getitem_fetches_channel(self, room, user):
+        peer = room.peers.connect(user.participant, 'peer_channel_name')
+        assert room.peers[peer.id].channel.name == 'peer_channel_name'
+        with pytest.raises(KeyError):
+            room.peers['nonexistent']
+
     @pytest.mark.usefixtures('redisdb')
     def test_get_participant(self, room, user, user2, participant3):
         peer = room.peers.connect(
@@ -86,4 +106,61 @@ class TestRoomPeers:
             'test'
         ) == json.dumps(testdata)
         assert peer['test'] == testdata
-        assert empty_room.peers.get_peer_data(peer.id, 'non-existent') is None
\ No newline at end of file
+        assert empty_room.peers.get_peer_data(peer.id, 'non-existent') is None
+
+    @pytest.mark.usefixtures('redisdb')
+    def test_snapshot(self, room, user, user2):
+        peer = room.peers.connect(user.participant, 'xxx')
+        peer2 = room.peers.connect(user2.participant, 'yyy')
+        peer['disk_usage'] = {'usage': 1, 'quota': 2}
+        assert room.peers.snapshot() == {
+            user.participant.id: {
+                'id': peer.id,
+                'data': {
+                    'channel': 'xxx',
+                    'disk_usage': {'usage': 1, 'quota': 2},
+                },
+            },
+            user2.participant.id: {
+                'id': peer2.id,
+                'data': {'channel': 'yyy'},
+            },
+        }
+
+    @pytest.mark.usefixtures('redisdb')
+    def test_snapshot_skips_disconnected(self, room, user, user2, mocker):
+        peer = room.peers.connect(user.participant, 'xxx')
+        peer2 = room.peers.connect(user2.participant, 'yyy')
+        ids = room.peers.ids
+        peer2.disconnect()
+        # as if peer2 disconnected after the ids were read
+        mocker.patch('rooms.peers.PeerManager.ids', new=ids)
+        assert room.peers.snapshot() == {
+            user.participant.id: {'id': peer.id, 'data': {'channel': 'xxx'}},
+        }
+
+    @pytest.mark.usefixtures('redisdb')
+    def test_snapshot_empty(self, empty_room):
+        assert empty_room.peers.snapshot() == {}
+
+    @pytest.mark.usefixtures('redisdb')
+    def test_hydrate_memberships(self, room, user, user2, mocker,
+                                 django_assert_num_queries):
+        peer = room.peers.connect(user.participant, 'xxx')
+        peer['resources'] = {'audio': True}
+        with django_assert_num_queries(1):
+            memberships = room.peers.hydrate_memberships(
+                room.memberships.all()
+            )
+        m1 = mocker.patch('rooms.peers.PeerManager.get_peer_data')
+        m2 = mocker.patch('rooms.peers.PeerManager.for_participant')
+        by_participant = {mem.participant_id: mem for mem in memberships}
+        mem = by_participant[user.participant.id]
+        assert mem.peer_id == peer.id
+        assert mem.resources == {'audio': True}
+        assert mem.disk_usage is None
+        mem2 = by_participant[user2.participant.id]
+        assert mem2.peer_id is None
+        assert mem2.resources is None
+        assert not m1.called
+        assert not m2.called
@@ -0,0 +1,62 @@
+import pytest
+
+from rooms import roomconfig
+from rooms.models import Room
+
+# the cache is only updated once changes are committed
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.usefixtures('redisdb'),
+]
+
+
+def test_get_cached(room, django_assert_num_queries):
+    room_config = roomconfig.get(room.id)
+    assert room_config.version == 0
+    assert room_config.data['mode'] == 'audio'
+    with django_assert_num_queries(0):
+        assert roomconfig.get(room.id).data == room_config.data
+
+
+def test_update(room):
+    roomconfig.get(room.id)
+    room_config = roomconfig.update(room.id, {'mode': 'video'})
+    assert room_config.version == 1
+    assert roomconfig.get(room.id).data['mode'] == 'video'
+    room.refresh_from_db()
+    assert room.config == {'mode': 'video'}
+    assert room.config_version == 1
+
+
+def test_updates_merged(room):
+    roomconfig.update(room.id, {'mode': 'video'})
+    roomconfig.update(room.id, {'debug_mode': True})
+    data = roomconfig.get(room.id).data
+    assert data['mode'] == 'video'
+    assert data['debug_mode']
+
+
+def test_conflict(room):
+    roomconfig.update(room.id, {'mode': 'video'}, version=0)
+    with pytest.raises(roomconfig.ConfigConflict) as e:
+        roomconfig.update(room.id, {'mode': 'audio'}, version=0)
+    assert e.value.version == 1
+    assert roomconfig.get(room.id).data['mode'] == 'video'
+
+
+def test_stale_cache(room):
+    roomconfig.get(room.id)
+    # changed by another process, which died before updating the cache
+    Room.objects.filter(id=room.id).update(
+        config={'mode': 'video'}, config_version=1
+    )
+    room_config = roomconfig.update(room.id, {'debug_mode': True})
+    assert room_config.version == 2
+    assert room_config.config == {'mode': 'video', 'debug_mode': True}
+    roomconfig.update(room.id, {'debug_mode': False}, version=2)
+
+
+def test_older_version_not_cached(room):
+    roomconfig.update(room.id, {'mode': 'video'})
+    roomconfig.store(room.id, roomconfig.RoomConfig(0, {}))
+    assert roomconfig.get(room.id).version == 1
@@ -2,9 +2,12 @@ import pytest
 import json
 import uuid
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 
-from rooms.models import Room, Message, RoomMembership
+from rooms.models import Room, Message, RoomMembership, Participant
+from recordings.models import Recording
 from rooms.serializers import MembershipSerializer
 from recordings.serializers import RecordingSerializer
 # from channels.test import ChannelTestCase
@@ -191,6 +194,47 @@ class TestRoom:
         pass
 
 
+@pytest.mark.usefixtures('redisdb')
+class TestInitialData:
+    def add_members(self, room, n):
+        for i in range(n):
+            participant = Participant.objects.create(name=f'Guest {i}')
+            room.memberships.create(participant=participant)
+            room.connect(participant, f'channel_{i}')
+            for j in range(3):
+                Recording.objects.create(
+                    participant=participant,
+                    room=room,
+                    type='audio/wav',
+                    started=now(),
+                    ended=now() if j else None,
+                )
+
+    def count_queries(self, room):
+        room = Room.objects.get(id=room.id)
+        with CaptureQueriesContext(connection) as ctx:
+            room.get_initial_data()
+        return len(ctx.captured_queries)
+
+    def test_query_count_independent_of_members(self, room):
+        self.add_members(room, 2)
+        num_queries = self.count_queries(room)
+        self.add_members(room, 10)
+        assert self.count_queries(room) == num_queries
+
+    def test_current_recording_id(self, room, user, recording):
+        in_progress = Recording.objects.create(
+            participant=user.participant,
+            room=room,
+            type='audio/wav',
+            started=now(),
+        )
+        members = room.get_initial_data()['members']
+        data = next(m for m in members if m['uid'] == user.participant.id)
+        assert data['info']['current_recording_id'] == in_progress.id.hex
+        assert len(data['info']['recordings']) == 2
+
+
 @pytest.mark.usefixtures('redisdb')
 class TestRoomSend:
     @pytest.fixture
@@ -0,0 +1,46 @@
+from collections import Counter
+
+from rooms import sharding
+
+
+def room_ids(n):
+    return [f'{i:06x}' for i in range(n)]
+
+
+class TestSharding:
+    def test_single_shard_uses_plain_names(self, settings):
+        settings.FIRESIDE_ROOM_SHARDS = 1
+        assert sharding.room_channel_name('receive', 'abcdef') == \
+            'room.receive'
+        assert sharding.method_mapping() == {
+            'room.join': 'join',
+            'room.leave': 'leave',
+            'room.receive': 'receive',
+        }
+
+    def test_sharded_names(self, settings):
+        settings.FIRESIDE_ROOM_SHARDS = 4
+        shard = sharding.shard_for_room('abcdef')
+        assert sharding.room_channel_name('join', 'abcdef') == \
+            f'room.join.{shard}'
+        mapping = sharding.method_mapping()
+        assert len(mapping) == 12
+        assert mapping['room.receive.3'] == 'receive'
+
+    def test_stable_and_balanced(self):
+        ids = room_ids(2000)
+        shards = [sharding.shard_for_room(id, 8) for id in ids]
+        assert shards == [sharding.shard_for_room(id, 8) for id in ids]
+        counts = Counter(shards)
+        assert set(counts) == set(range(8))
+        assert min(counts.values()) > 2000 / 8 * 0.75
+
+    def test_consistent_when_adding_shards(self):
+        ids = room_ids(2000)
+        moved = [
+            id for id in ids
+            if sharding.shard_for_room(id, 8) != sharding.shard_for_room(id, 9)
+        ]
+        # only rooms moving to the new shard change
+        assert all(sharding.shard_for_room(id, 9) == 8 for id in moved)
+        assert len(moved) < 2000 / 9 * 1.5
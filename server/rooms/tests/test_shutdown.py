@@ -0,0 +1,22 @@
+import signal
+
+import pytest
+
+from rooms import shutdown
+
+
+def test_sigterm_exits(mocker):
+    mocker.patch('signal.getsignal', return_value=signal.SIG_DFL)
+    set_handler = mocker.patch('signal.signal')
+    assert shutdown.install_sigterm_handler()
+    set_handler.assert_called_once_with(signal.SIGTERM, shutdown._exit)
+    # so that atexit callbacks run
+    with pytest.raises(SystemExit):
+        shutdown._exit(signal.SIGTERM, None)
+
+
+def test_existing_handler_kept(mocker):
+    mocker.patch('signal.getsignal', return_value=lambda signum, frame: None)
+    set_handler = mocker.patch('signal.signal')
+    assert not shutdown.install_sigterm_handler()
+    assert not set_handler.called
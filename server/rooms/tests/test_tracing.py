@@ -0,0 +1,27 @@
+import logging
+
+from rooms.tracing import Trace
+
+
+class TestTrace:
+    def test_not_sampled(self, settings):
+        settings.FIRESIDE_TRACE_SAMPLE_RATE = 0
+        assert Trace.start() is None
+
+    def test_content_round_trip(self, settings):
+        settings.FIRESIDE_TRACE_SAMPLE_RATE = 1.0
+        trace = Trace.start()
+        trace = Trace.from_content({'trace': trace.to_content()})
+        trace.stamp('dequeued')
+        assert [name for name, t in trace.stamps] == ['ingress', 'dequeued']
+        assert Trace.from_content({}) is None
+
+    def test_slow_message_logged(self, settings, caplog):
+        settings.FIRESIDE_TRACE_SLOW_THRESHOLD = 0.5
+        settings.FIRESIDE_TRACE_SLOW_LOG_SAMPLE_RATE = 1.0
+        labels = {'type': 'event', 'event_type': 'update_status'}
+        with caplog.at_level(logging.WARNING, logger='rooms.tracing'):
+            Trace([('ingress', 100.0), ('dequeued', 100.1)]).finish(labels)
+            assert not caplog.records
+            Trace([('ingress', 100.0), ('dequeued', 100.7)]).finish(labels)
+        assert 'dequeued +700.0ms' in caplog.records[0].getMessage()
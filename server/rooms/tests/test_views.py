@@ -1,6 +1,9 @@
 import pytest
 from django.urls import reverse
 from rooms.models import Message, Room
+from rooms.livestate import RecordingStateFlusher
+from recordings.serializers import RecordingSerializer
+import json
 import re
 import datetime
 from django.utils import timezone
@@ -35,6 +38,60 @@ class TestCreateRoomView:
         assert room.owner.session_key == api_client.session.session_key
 
 
+@pytest.mark.django_db
+@pytest.mark.usefixtures('redisdb')
+class TestRoomView:
+    def get_config(self, response):
+        return json.loads(response.context['config_json'])
+
+    def test_404_if_non_existent_room(self, client):
+        url = reverse('rooms:room', kwargs={'room_id': 'ZZZZZZ'})
+        assert client.get(url).status_code == 404
+
+    def test_data(self, client, room, user2):
+        client.force_login(user2)
+        response = client.get(room.get_absolute_url())
+        assert response.status_code == 200
+        data = self.get_config(response)['roomData']
+        assert data['id'] == room.id
+        assert data['owner']['id'] == room.owner.id
+        assert data['self']['id'] == user2.participant.id
+        assert not data['self']['isNew']
+
+    def test_not_modified(self, client, room, user2):
+        client.force_login(user2)
+        response = client.get(room.get_absolute_url())
+        etag = response['ETag']
+        response = client.get(room.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        room.memberships.filter(participant=user2.participant) \
+            .update(onboarding_complete=True)
+        response = client.get(room.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_room_data_cached(self, client, room, user2,
+                              django_assert_num_queries):
+        client.force_login(user2)
+        client.get(room.get_absolute_url())
+        # the session, the user and the membership
+        with django_assert_num_queries(3):
+            client.get(room.get_absolute_url())
+
+    # invalidation waits for the transaction to commit
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.usefixtures('channel_test')
+    def test_invalidated(self, client, room, user, user2):
+        client.force_login(user2)
+        client.get(room.get_absolute_url())
+        room.config = {'mode': 'video'}
+        room.save()
+        room.change_member_name(user.participant, 'Host')
+        data = self.get_config(client.get(room.get_absolute_url()))
+        assert data['roomData']['config']['mode'] == 'video'
+        assert data['roomData']['owner']['name'] == 'Host'
+
+
 @pytest.mark.django_db
 class TestRoomMessagesView:
     def test_403_if_non_existent_room(self, api_client):
@@ -75,9 +132,45 @@ class TestRoomMessagesView:
             'peer_id': None,
         }]
 
-    @pytest.mark.skip
-    def test_pagination(self):
-        pass
+    def test_pagination(self, api_client, room, user):
+        ts = timezone.now().replace(microsecond=0)
+        # several messages in the same millisecond must page stably, even
+        # when their ids aren't in the same order as their timestamps
+        messages = [room.messages.create(
+            type='e',
+            payload={'type': 'test', 'data': x},
+            timestamp=ts - datetime.timedelta(
+                seconds=x // 4, microseconds=(x * 337) % 1000
+            ),
+        ) for x in range(20)]
+        expected = sorted(messages, key=lambda m: (m.timestamp, m.id))[::-1]
+        url = reverse('rooms:messages', kwargs={'room_id': room.id})
+        api_client.force_login(user)
+        seen = []
+        response = api_client.get(url + '?limit=3')
+        while response.data:
+            assert len(response.data) <= 3
+            seen += [x['id'] for x in response.data]
+            last = response.data[-1]
+            response = api_client.get(
+                url + f"?limit=3&until={last['timestamp']}"
+                f"&until_id={last['id']}"
+            )
+        assert seen == [m.id for m in expected]
+
+    def test_unknown_until_id(self, api_client, room, user):
+        url = reverse('rooms:messages', kwargs={'room_id': room.id})
+        api_client.force_login(user)
+        response = api_client.get(url + '?until=0&until_id=12345')
+        assert response.status_code == 400
+
+    def test_limit_capped(self, api_client, room, user):
+        url = reverse('rooms:messages', kwargs={'room_id': room.id})
+        api_client.force_login(user)
+        response = api_client.get(url + '?limit=100000')
+        assert response.status_code == 200
+        response = api_client.get(url + '?limit=0')
+        assert response.status_code == 400
 
     def test_until(self, api_client, room, user):
         messages = [room.messages.create(
@@ -125,6 +218,7 @@ class TestRoomMessagesView:
         pass
 
 @pytest.mark.django_db
+@pytest.mark.usefixtures('redisdb')
 class TestRecordingsView:
     def test_403_if_non_existent_room(self, api_client):
         url = reverse('rooms:recordings', kwargs={'room_id': 'ZZZZZZ'})
@@ -199,15 +293,59 @@ class TestRecordingsView:
             'type': 'video/webm',
         }]
         response = api_client.put(url, data, format='json')
-        msg = mock_send.call_args_list[0][0][1]
-        assert msg.type == 'e'
-        assert msg.payload['type'] == 'update_recording'
-        assert msg.payload['data'] == {'room_id': room.id, **data[0]}
-        msg = mock_send.call_args_list[1][0][1]
+        assert response.status_code == 200
+        assert mock_send.call_count == 1
+        msg = mock_send.call_args[0][1]
         assert msg.type == 'e'
-        assert msg.payload['type'] == 'update_recording'
-        assert msg.payload['data'] == {'room_id': room.id, **data[1]}
+        assert msg.payload['type'] == 'update_recordings'
+        sent = {r['id']: r for r in msg.payload['data']}
+        assert set(sent) == {d['id'] for d in data}
+        assert sent[data[0]['id']]['type'] == 'audio/wav'
+        assert sent[data[1]['id']]['ended'] == 1493823170000
+        recording.refresh_from_db()
+        assert recording.ended is not None
+        assert room.recordings.count() == 2
+
+    def test_update_unchanged(self, room, api_client, user, recording,
+                              mocker):
+        api_client.force_login(user)
+        url = reverse('rooms:recordings', kwargs={'room_id': room.id})
+        data = RecordingSerializer(recording).data
+        data['duration'] = 60
+        mock_send = mocker.patch('rooms.models.room.Room.send', autospec=True)
+        api_client.put(url, [data], format='json')
+        assert mock_send.call_count == 1
+        mock_send.reset_mock()
+        response = api_client.put(url, [data], format='json')
         assert response.status_code == 200
+        assert not mock_send.called
+        # duration is live, so it's only saved by the next flush
+        assert room.peers.get_recording_states()[str(recording.id)] == (
+            user.participant.id, {'duration': 60}
+        )
+        recording.refresh_from_db()
+        assert recording.duration == 0
+        assert RecordingStateFlusher().flush() == 1
+        recording.refresh_from_db()
+        assert recording.duration == 60
+
+    def test_update_same_timestamps(self, room, api_client, user, recording,
+                                    mocker):
+        # what clients send back only has millisecond precision
+        recording.started = recording.started.replace(microsecond=123000)
+        recording.ended = recording.ended.replace(microsecond=456000)
+        recording.save()
+        api_client.force_login(user)
+        url = reverse('rooms:recordings', kwargs={'room_id': room.id})
+        data = RecordingSerializer(recording).data
+        mock_send = mocker.patch('rooms.models.room.Room.send', autospec=True)
+        mock_update = mocker.patch(
+            'recordings.models.RecordingQuerySet.bulk_update'
+        )
+        response = api_client.put(url, [data], format='json')
+        assert response.status_code == 200
+        assert not mock_send.called
+        assert not mock_update.called
 
 
 @pytest.mark.django_db
@@ -300,5 +438,46 @@ class TestRoomActionView:
             'data': {
                 'mode': 'video',
                 'video_bitrate': None,
+                'version': 1,
             },
         }
+
+    @pytest.mark.usefixtures('redisdb', 'channel_test')
+    def test_update_config_conflict(self, api_client, room, user, mocker):
+        url = reverse('rooms:action', kwargs={
+            'room_id': room.id,
+            'name': 'update_config',
+        })
+        api_client.force_login(user)
+        mocker.patch('rooms.models.room.Room.send', autospec=True)
+        response = api_client.post(url, {
+            'mode': 'video',
+            'version': 0,
+        }, format='json')
+        assert response.status_code == 200
+        response = api_client.post(url, {
+            'debug_mode': True,
+            'version': 0,
+        }, format='json')
+        assert response.status_code == 409
+        assert response.data['version'] == 1
+        assert response.data['mode'] == 'video'
+        assert not response.data['debug_mode']
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('redisdb')
+class TestRoomConfigView:
+    def test_not_modified(self, api_client, room, user):
+        url = reverse('rooms:config', kwargs={'room_id': room.id})
+        api_client.force_login(user)
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response.data['version'] == 0
+        assert response.data['mode'] == 'audio'
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == 304
+
+    def test_403_if_not_in_room(self, room, participant3_client):
+        url = reverse('rooms:config', kwargs={'room_id': room.id})
+        assert participant3_client.get(url).status_code == 403
@@ -0,0 +1,70 @@
+import pytest
+
+from rooms.models import Message
+from rooms.writebehind import MessageWriter
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def writer():
+    return MessageWriter(batch_size=3, interval=60, autostart=False)
+
+
+class TestMessageWriter:
+    def test_ids_assigned_up_front(self, writer, room):
+        messages = [
+            room.message(type=Message.TYPE.event, payload={'n': i})
+            for i in range(5)
+        ]
+        for msg in messages:
+            writer.enqueue(msg)
+        ids = [msg.id for msg in messages]
+        assert None not in ids
+        assert len(set(ids)) == 5
+        assert room.messages.count() == 0
+        assert len(writer) == 5
+
+    def test_flush(self, writer, room):
+        messages = [
+            room.message(type=Message.TYPE.event, payload={'n': i})
+            for i in range(4)
+        ]
+        for msg in messages:
+            writer.enqueue(msg)
+        assert writer.flush() == 4
+        assert len(writer) == 0
+        assert writer.flush() == 0
+        saved = room.messages.order_by('id')
+        assert [m.id for m in saved] == [m.id for m in messages]
+        assert [m.payload for m in saved] == [m.payload for m in messages]
+        assert [m.timestamp for m in saved] == \
+            [m.timestamp for m in messages]
+
+    def test_wakes_up_when_batch_full(self, writer, room):
+        for i in range(2):
+            writer.enqueue(room.message(type=Message.TYPE.event, payload={}))
+        assert not writer._wakeup.is_set()
+        writer.enqueue(room.message(type=Message.TYPE.event, payload={}))
+        assert writer._wakeup.is_set()
+
+    def test_flushes_overdue_messages(self, room):
+        writer = MessageWriter(batch_size=3, interval=60, max_age=0,
+                               autostart=False)
+        writer.enqueue(room.message(type=Message.TYPE.event, payload={}))
+        assert len(writer) == 0
+        assert room.messages.count() == 1
+
+    def test_room_add_message(self, room, settings, mocker):
+        settings.FIRESIDE_MESSAGE_WRITE_BEHIND = True
+        writer = MessageWriter(batch_size=3, interval=60, autostart=False)
+        mocker.patch(
+            'rooms.models.room.get_message_writer',
+            return_value=writer
+        )
+        msg = room.message(type=Message.TYPE.announce, payload={})
+        room.add_message(msg)
+        assert msg.id is not None
+        assert not room.messages.exists()
+        writer.flush()
+        assert room.messages.get().id == msg.id
@@ -0,0 +1,79 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from fireside import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """
+    Timestamps of the hops a message takes through the channel pipeline,
+    e.g. ingress (received on the socket), dequeued (picked up by
+    RoomConsumer), saved and fanout (sent on by Room.send).
+
+    A trace travels with the message in the channel message content (see
+    `to_content`), and is recorded as latency histograms when finished.
+    """
+    def __init__(self, stamps=None):
+        self.stamps = stamps or []
+
+    @classmethod
+    def start(cls):
+        """
+        Start a trace for a newly received message, or return None if it
+        isn't sampled (see FIRESIDE_TRACE_SAMPLE_RATE).
+        """
+        rate = settings.FIRESIDE_TRACE_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return None
+        trace = cls()
+        trace.stamp('ingress')
+        return trace
+
+    @classmethod
+    def from_content(cls, content):
+        stamps = content.get('trace')
+        if not stamps:
+            return None
+        return cls([tuple(stamp) for stamp in stamps])
+
+    def to_content(self):
+        return [list(stamp) for stamp in self.stamps]
+
+    def stamp(self, name):
+        # wall clock time, as hops may happen in different processes
+        self.stamps.append((name, time.time()))
+
+    @property
+    def total(self):
+        return self.stamps[-1][1] - self.stamps[0][1]
+
+    def timeline(self):
+        start = self.stamps[0][1]
+        return ', '.join(
+            f'{name} +{(t - start) * 1000:.1f}ms' for name, t in self.stamps
+        )
+
+    def finish(self, labels):
+        """
+        Record the latency of each hop and the total, labelled with the
+        message's `labels`, and log the timeline if the message was slow.
+        """
+        for (prev, prev_t), (name, t) in zip(self.stamps, self.stamps[1:]):
+            metrics.trace_hop_latency.observe(
+                t - prev_t, hop=f'{prev}-{name}', **labels
+            )
+        total = self.total
+        metrics.trace_latency.observe(total, **labels)
+        slow = total >= settings.FIRESIDE_TRACE_SLOW_THRESHOLD
+        sample_rate = settings.FIRESIDE_TRACE_SLOW_LOG_SAMPLE_RATE
+        if slow and random.random() < sample_rate:
+            logger.warning(
+                'Slow %s message (%s) took %.1fms: %s',
+                labels['type'], labels['event_type'] or '-',
+                total * 1000, self.timeline()
+            )
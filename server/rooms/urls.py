@@ -2,6 +2,9 @@
 from django.conf.urls import url
 
 from . import views
+from recordings import views as recording_views
+
+upload_prefix = r'^(?P<room_id>\w+)/uploads/recording:(?P<recording_id>[0-9a-f-]+)/'
 
 urlpatterns = [
     url(r'^$', views.CreateRoomView.as_view(), name='create'),
@@ -9,7 +12,15 @@ urlpatterns = [
     url(r'^(?P<room_id>\w+)/join/$', views.JoinRoomView.as_view(), name='join'),
     url(r'^(?P<room_id>\w+)/messages/$', views.RoomMessagesView.as_view(), name='messages'),
     url(r'^(?P<room_id>\w+)/recordings/$', views.RoomRecordingsView.as_view(), name='recordings'),
+    url(r'^(?P<room_id>\w+)/recordings/export/$', recording_views.RecordingsExportView.as_view(), name='recordings_export'),
+    url(r'^(?P<room_id>\w+)/recordings/(?P<recording_id>[0-9a-f-]+)/download/$', recording_views.RecordingDownloadView.as_view(), name='recording_download'),
+    url(r'^(?P<room_id>\w+)/config/$', views.RoomConfigView.as_view(), name='config'),
     url(r'^(?P<room_id>\w+)/participants/$', views.RoomParticipantsView.as_view(), name='users'),
     url(r'^(?P<room_id>\w+)/participants/(?P<participant_id>\d+)/name/$', views.ChangeNameView.as_view(), name='change_name'),
     url(r'^(?P<room_id>\w+)/actions/(?P<name>\w+)/$', views.RoomActionView.as_view(), name='action'),
+    url(upload_prefix + r'$', recording_views.InitiateUploadView.as_view(), name='upload_initiate'),
+    url(upload_prefix + r'(?P<upload_id>[0-9a-f]+)/chunks/(?P<index>\d+)/$', recording_views.UploadChunkUrlView.as_view(), name='upload_chunk'),
+    url(upload_prefix + r'(?P<upload_id>[0-9a-f]+)/complete/$', recording_views.CompleteUploadView.as_view(), name='upload_complete'),
+    url(upload_prefix + r'(?P<upload_id>[0-9a-f]+)/abort/$', recording_views.AbortUploadView.as_view(), name='upload_abort'),
+    url(r'^uploads/chunks/(?P<token>[\w:-]+)/$', recording_views.UploadChunkDataView.as_view(), name='upload_chunk_data'),
 ]
\ No newline at end of file
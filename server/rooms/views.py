@@ -1,8 +1,12 @@
 from datetime import datetime, timezone
-from django.views.generic import DetailView, View
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404
+from django.views.generic import View
+from django.http import HttpResponseRedirect, Http404
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.db import IntegrityError
+from django.db.models import Q
+import hashlib
 import json
 
 from rest_framework import status
@@ -10,11 +14,16 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import ListCreateAPIView, ListAPIView
 from rest_framework.permissions import BasePermission
+from rest_framework.exceptions import ValidationError
 
+from . import roomconfig
+from .bootstrap import get_room_document
+from .context import RoomContext
 from .models import Room, Participant, RoomMembership, Message
 from .serializers import (
     MembershipSerializer,
     MessageSerializer,
+    MessageHistoryParamsSerializer,
     PeerActionSerializer,
     JoinRoomSerializer,
     RoomConfigSerializer,
@@ -23,94 +32,92 @@ from .serializers import (
 from recordings.serializers import RecordingSerializer
 
 
-class HasRoomAccess(BasePermission):
+class RoomPermission(BasePermission):
+    """
+    Loads the request's room context (see `RoomContext`), and sets
+    `request.room` and `request.participant` from it for the view.
+    """
     def has_permission(self, request, view):
-        try:
-            room = request.room = \
-                Room.objects.get(id=view.kwargs.get('room_id'))
-        except Room.DoesNotExist:
-            return False
-        try:
-            participant = request.participant = \
-                Participant.objects.from_request(request)
-        except Participant.DoesNotExist:
+        context = RoomContext.for_request(request, view.kwargs.get('room_id'))
+        if context is None or context.participant is None:
             return False
-        request.participant = participant
-        return room.is_member(participant)
+        request.room_context = context
+        request.room = context.room
+        request.participant = context.participant
+        return self.check(context)
 
+    def check(self, context):
+        """Whether to allow the request, given its room `context`."""
+        return False
 
-class IsRoomAdmin(BasePermission):
-    def has_permission(self, request, view):
-        try:
-            room = request.room = \
-                Room.objects.get(id=view.kwargs.get('room_id'))
-        except Room.DoesNotExist:
-            return False
-        try:
-            participant = request.participant = \
-                Participant.objects.from_request(request)
-        except Participant.DoesNotExist:
-            return False
-        request.participant = participant
-        return room.is_admin(participant)
 
+class HasRoomAccess(RoomPermission):
+    def check(self, context):
+        return context.is_member
 
-class RoomView(DetailView):
-    model = Room
-    template_name = 'rooms/room.html'
-    pk_url_kwarg = 'room_id'
-    context_object_name = 'room'
 
-    def get_context_data(self, **ctx):
-        ctx = super().get_context_data(**ctx)
+class IsRoomAdmin(RoomPermission):
+    def check(self, context):
+        return context.is_admin
 
-        # TODO refactor me
-        membership = None
-        participant = None
+
+class RoomView(View):
+    template_name = 'rooms/room.html'
+
+    def get(self, request, room_id):
         try:
-            participant = Participant.objects.from_request(self.request)
-            membership = self.object.memberships.filter(
-                participant=participant
-            ).first()
+            document = get_room_document(room_id)
+        except Room.DoesNotExist:
+            raise Http404
+        try:
+            participant = Participant.objects.from_request(request)
         except Participant.DoesNotExist:
-            pass
-
-        owner_mem = self.object.memberships.filter(
-            participant=self.object.owner
-        ).first()
+            participant = None
+        membership = None
+        if participant is not None:
+            membership = RoomMembership.objects.filter(
+                room_id=room_id, participant=participant
+            ).first()
+        name, onboarding_complete = None, False
+        if membership is not None:
+            membership.participant = participant
+            name = membership.get_display_name()
+            onboarding_complete = membership.onboarding_complete
 
-        ctx['config_json'] = json.dumps({
+        config_json = json.dumps({
             "roomData": {
-                "id": self.object.id,
-                "owner": {
-                    "id": self.object.owner.id,
-                    "name": owner_mem.get_display_name() if owner_mem else None,
-                    "role": "o",
-                },
+                **document['room'],
                 "self": {
                     "id": participant.id if participant is not None else None,
-                    "name": membership.get_display_name() if membership is not None else None,
+                    "name": name,
                     "isNew": membership is None,
-                    "onboardingComplete": (
-                        membership is not None and
-                        membership.onboarding_complete
-                    )
+                    "onboardingComplete": onboarding_complete,
                 },
-                "config": self.object.get_config(),
             },
             "opts": {
-                "urls": {
-                    "socket": self.object.get_full_socket_url(),
-                    "join": self.object.get_join_url(),
-                    "messages": self.object.get_messages_url(),
-                    "recordings": self.object.get_recordings_url(),
-                    "action": self.object.get_absolute_url() + "actions/:name/",
-                    "changeName": self.object.get_absolute_url() + "participants/:uid/name/",
-                },
+                "urls": document['urls'],
             },
         })
 
-        return ctx
+        # clients revalidate on every load, so that a reload storm is
+        # mostly answered with 304s
+        etag = quote_etag(hashlib.md5(config_json.encode()).hexdigest())
+        last_modified = document['modified']
+        if membership is not None:
+            last_modified = max(last_modified, membership.joined.timestamp())
+        last_modified = int(last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = render(request, self.template_name, {
+                'room': document['room'],
+                'config_json': config_json,
+            })
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class CreateRoomView(View):
@@ -154,7 +161,7 @@ class ChangeNameView(APIView):
         participant = get_object_or_404(Participant, id=participant_id)
         if (
             participant != request.participant and not
-            request.room.is_admin(request.participant)
+            request.room_context.is_admin
         ):
             return Response(
                 data="Must be admin to change other member's name",
@@ -176,6 +183,10 @@ class ChangeNameView(APIView):
 class RoomMessagesView(ListAPIView):
     permission_classes = (HasRoomAccess,)
     serializer_class = MessageSerializer
+    #: page size when no limit is given
+    default_limit = 100
+    #: the most messages that can be requested at once
+    max_limit = 500
 
     def post(self, request, **kwargs):
         serializer = self.serializer_class(data=request.data)
@@ -196,15 +207,26 @@ class RoomMessagesView(ListAPIView):
             )
 
     def get_queryset(self):
+        params = MessageHistoryParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
         qs = self.request.room.messages.all()
-        if 'until' in self.request.query_params:
-            qs = qs.filter(
-                timestamp__lt=datetime.fromtimestamp(
-                    int(self.request.query_params['until']) / 1000,
-                    timezone.utc,
-                ),
-            )
-        return qs
+        if 'until_id' in params:
+            # continue from exactly where the last page ended, on the same
+            # (timestamp, id) the messages are ordered by
+            until = qs.filter(id=params['until_id']) \
+                .values_list('timestamp', flat=True).first()
+            if until is None:
+                raise ValidationError({'until_id': 'No such message.'})
+            earlier = Q(timestamp__lt=until)
+            same_time = Q(timestamp=until, id__lt=params['until_id'])
+            qs = qs.filter(earlier | same_time)
+        elif 'until' in params:
+            until = datetime.fromtimestamp(params['until'] / 1000, timezone.utc)
+            qs = qs.filter(timestamp__lt=until)
+        limit = min(params.get('limit', self.default_limit), self.max_limit)
+        return qs[:limit]
 
 
 class RoomRecordingsView(ListCreateAPIView):
@@ -237,7 +259,29 @@ class RoomParticipantsView(ListAPIView):
     serializer_class = MembershipSerializer
 
     def get_queryset(self):
-        return RoomMembership.objects.filter(room_id=self.kwargs['room_id'])
+        return self.request.room.peers.hydrate_memberships(
+            RoomMembership.objects.filter(
+                room_id=self.kwargs['room_id']
+            ).with_peer_info(self.request.room)
+        )
+
+
+class RoomConfigView(APIView):
+    """
+    The room config. Clients that already have a version of it send it
+    as the ETag (in If-None-Match), and get a 304 if it's still current.
+    """
+    permission_classes = (HasRoomAccess,)
+
+    def get(self, request, room_id):
+        room_config = roomconfig.get(room_id)
+        etag = quote_etag(str(room_config.version))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(room_config.to_json())
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class RoomActionView(APIView):
@@ -277,7 +321,7 @@ class RoomActionView(APIView):
         )
 
     def update_config(self):
-        serializer = RoomConfigSerializer(self.request.room.config,
+        serializer = RoomConfigSerializer(
             data=self.request.data,
             partial=True
         )
@@ -286,7 +330,15 @@ class RoomActionView(APIView):
                 data=serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
-        self.request.room.set_config(serializer.validated_data)
+        changes = dict(serializer.validated_data)
+        version = changes.pop('version', None)
+        try:
+            self.request.room.set_config(changes, version=version)
+        except roomconfig.ConfigConflict as e:
+            return Response(
+                data={**e.data, 'version': e.version},
+                status=status.HTTP_409_CONFLICT
+            )
         return Response(data='OK', status=status.HTTP_200_OK)
 
     def start_recording(self):
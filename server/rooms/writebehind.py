@@ -0,0 +1,131 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, close_old_connections
+
+from .models.message import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Queues room messages and persists them in batches with `bulk_create`,
+    from a background thread, either once `batch_size` messages are queued
+    or every `interval` seconds.
+
+    Messages are given their ids up front (reserved in blocks from the
+    message table's sequence) so that they can be broadcast before they
+    are written. Anything still queued is flushed when the process exits
+    (see `install_sigterm_handler`), and messages that have been queued for
+    longer than `max_age` seconds are flushed straight away, in case the
+    background thread falls behind.
+    """
+    def __init__(self, batch_size=None, interval=None, max_age=None,
+                 autostart=True):
+        self.batch_size = batch_size or settings.FIRESIDE_MESSAGE_BATCH_SIZE
+        self.interval = interval or settings.FIRESIDE_MESSAGE_FLUSH_INTERVAL
+        if max_age is None:
+            max_age = settings.FIRESIDE_MESSAGE_MAX_QUEUE_AGE
+        self.max_age = max_age
+        self.autostart = autostart
+        self._queue = []
+        self._queued_since = None
+        self._ids = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def reserve_ids(self, n):
+        """Reserve `n` ids from the message table's sequence."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                "FROM generate_series(1, %s)",
+                [Message._meta.db_table, n]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def enqueue(self, message):
+        """
+        Assign `message` an id and queue it to be saved. Doesn't touch the
+        database unless a new block of ids is needed.
+        """
+        if self.autostart:
+            self.start()
+        with self._lock:
+            if not self._ids:
+                self._ids = self.reserve_ids(self.batch_size)
+            message.id = self._ids.pop(0)
+            if not self._queue:
+                self._queued_since = time.monotonic()
+            self._queue.append(message)
+            queued = len(self._queue)
+            overdue = time.monotonic() - self._queued_since >= self.max_age
+        if overdue:
+            self.flush()
+        elif queued >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Save all queued messages. Returns the number saved."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return 0
+            close_old_connections()
+            try:
+                Message.objects.bulk_create(batch)
+            except Exception:
+                # fall back to saving one by one, so that one bad message
+                # (e.g. for a deleted room) doesn't lose the whole batch
+                logger.exception('Failed to save batch of %d messages',
+                                 len(batch))
+                for message in batch:
+                    try:
+                        message.save(force_insert=True)
+                    except Exception:
+                        logger.exception('Failed to save message %s',
+                                         message.id)
+            return len(batch)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='MessageWriter',
+                    daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Message flush failed')
+                time.sleep(self.interval)
+
+    def __len__(self):
+        return len(self._queue)
+
+
+_writer = None
+
+
+def get_message_writer():
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter()
+    return _writer